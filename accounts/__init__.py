@@ -0,0 +1,3 @@
+from accounts.account import Account
+
+__all__ = ["Account"]
@@ -0,0 +1,149 @@
+from typing import Callable, Dict, Any, Optional
+
+from clients.capture_recorder import CaptureRecorder
+from clients.circuit_breaker import CircuitBreaker
+from clients.group_gate import GroupGate
+from clients.llm.base import LLMServiceAdapter
+from clients.llm_client import LLMClient, DEFAULT_UNAVAILABLE_REPLY
+from clients.signal_client import SignalClient
+from clients.typing_client import TypingClient
+from commands.command_manager import CommandManager
+from config.config_manager import namespaced_file
+from memory.memory_manager import MemoryManager
+from utils.logging_setup import logger
+from utils.profiler import SlowMessageProfiler
+
+
+class Account:
+    # Everything tied to one Signal identity. LLM backends and their circuit breakers,
+    # request and send slots and the profiler are owned by Application and shared between accounts.
+    def __init__(self, config: Dict[str, Any], api_key: str, service_adapter: LLMServiceAdapter,
+                 circuit_breaker: CircuitBreaker, request_slots=None, send_slots=None,
+                 profiler: Optional[SlowMessageProfiler] = None, partition: Optional[int] = None):
+        self.phone_number = config["phone_number"]
+        self.api_key = api_key
+
+        self.memory_manager = MemoryManager(
+            has_memory=config["has_memory"],
+            save_memory=config["save_memory"],
+            memory_file=namespaced_file(config["memory_file"], partition)
+        )
+
+        # Optional traffic capture for replay benchmarks
+        self.recorder = None
+        if config.get("capture_file"):
+            self.recorder = CaptureRecorder(
+                capture_file=namespaced_file(config["capture_file"], partition),
+                phone_number=self.phone_number,
+                commands=[config["reset_memory_word"]] if config.get("reset_memory_word") else []
+            )
+
+        self.typing_client = TypingClient(
+            signal_service=config["signal_service"],
+            phone_number=self.phone_number,
+            refresh_interval=10
+        )
+
+        self.llm_client = LLMClient(
+            llm_service_url=config["llm_service_url"],
+            llm_api_key=config["llm_api_key"] if not api_key else api_key,
+            llm_service_provider=config["llm_service_provider"],
+            llm_model_options=config["llm_model_options"],
+            memory_manager=self.memory_manager,
+            typing_client=self.typing_client,
+            recorder=self.recorder,
+            circuit_breaker=circuit_breaker,
+            service_adapter=service_adapter,
+            request_slots=request_slots,
+            unavailable_reply=config.get("llm_unavailable_reply") or DEFAULT_UNAVAILABLE_REPLY,
+            chunk_tokens=config.get("llm_chunk_tokens"),
+            max_continuations=config.get("llm_max_continuations", 8)
+        )
+
+        self.command_manager = self._build_command_manager(config)
+
+        self.signal_client = SignalClient(
+            signal_service=config["signal_service"],
+            phone_number=self.phone_number,
+            save_attachments=config["save_attachments"],
+            memory_manager=self.memory_manager,
+            llm_client=self.llm_client,
+            typing_client=self.typing_client,
+            command_manager=self.command_manager,
+            recorder=self.recorder,
+            profiler=profiler,
+            ping_interval=config.get("websocket_ping_interval", 20),
+            ping_timeout=config.get("websocket_ping_timeout", 20),
+            catch_up=config.get("catch_up_on_reconnect", False),
+            outbound_options={
+                "max_message_length": config.get("max_message_length", 2000),
+                "inline_attachments": config.get("inline_attachments", True),
+                "send_slots": send_slots
+            },
+            group_gate=self._build_group_gate(config)
+        )
+        self._group_settings = self._group_gate_settings(config)
+
+    def _build_command_manager(self, config: Dict[str, Any]) -> CommandManager:
+        command_manager = CommandManager()
+
+        # Register command(s)
+        if config.get("reset_memory_word"):
+            command_manager.register_command(
+                config["reset_memory_word"],
+                self._reset_memory_command
+            )
+        return command_manager
+
+    @staticmethod
+    def _group_gate_settings(config: Dict[str, Any]) -> tuple:
+        return config.get("group_triggers"), config.get("account_uuid")
+
+    def _build_group_gate(self, config: Dict[str, Any]) -> Optional[GroupGate]:
+        # Without group triggers every group message is answered
+        if not config.get("group_triggers"):
+            return None
+        return GroupGate(self.phone_number, config["group_triggers"], config.get("account_uuid"))
+
+    def prepare_reconfigure(self, config: Dict[str, Any], service_adapter: LLMServiceAdapter,
+                            circuit_breaker: CircuitBreaker) -> Callable[[], None]:
+        # Builds everything a reloaded config needs and returns the function that swaps it in. Anything
+        # that can fail fails here, before the account changed. The swap itself only assigns and does not
+        # await, so a message sees either the old or the new settings. Messages already talking to the LLM
+        # finish on the adapter they started with.
+        command_manager = self._build_command_manager(config)
+        # An unchanged gate is kept along with the group context it remembers
+        group_settings = self._group_gate_settings(config)
+        group_gate = self.signal_client.group_gate
+        if group_settings != self._group_settings:
+            group_gate = self._build_group_gate(config)
+        system_prompt_changed = service_adapter.system_prompt != self.llm_client.service_adapter.system_prompt
+        system_prompt = service_adapter.get_system_prompt() if system_prompt_changed else None
+        llm_api_key = config["llm_api_key"] if not self.api_key else self.api_key
+        unavailable_reply = config.get("llm_unavailable_reply") or DEFAULT_UNAVAILABLE_REPLY
+
+        def apply() -> None:
+            self.llm_client.service_adapter = service_adapter
+            self.llm_client.circuit_breaker = circuit_breaker
+            self.llm_client.llm_api_key = llm_api_key
+            self.llm_client.unavailable_reply = unavailable_reply
+            self.llm_client.chunk_tokens = config.get("llm_chunk_tokens")
+            self.llm_client.max_continuations = config.get("llm_max_continuations", 8)
+            self.command_manager = command_manager
+            self.signal_client.command_manager = command_manager
+            self.signal_client.group_gate = group_gate
+            self._group_settings = group_settings
+            self.signal_client.outbound.max_message_length = config.get("max_message_length", 2000)
+            self.signal_client.outbound.inline_attachments = config.get("inline_attachments", True)
+            if system_prompt_changed and self.memory_manager.has_memory:
+                self.memory_manager.set_system_prompt(system_prompt)
+        return apply
+
+    async def _reset_memory_command(self) -> None:
+        self.memory_manager.reset_memory()
+        if self.llm_client.service_adapter.system_prompt:
+            system_prompt = self.llm_client.service_adapter.get_system_prompt()
+            if system_prompt:
+                self.memory_manager.set_memory([system_prompt])
+        await self.memory_manager.save_conversation()
+        logger.info("Memory reset command executed for %s", self.phone_number)
@@ -0,0 +1,118 @@
+"""
+Stand-in for an OpenAI-compatible chat completion server (llama.cpp-server or ollama) used by the benchmarks.
+Latency is simulated per token: prefill scales with prompt length, decode with reply length.
+Requests beyond the number of slots wait for a free slot, like a busy llama.cpp-server.
+"""
+import asyncio
+import json
+import time
+from typing import Dict, Any, Optional
+
+from aiohttp import web
+from utils.logging_setup import logger
+
+
+class FakeLLMServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, slots: int = 1,
+                 prefill_ms_per_token: float = 0.2, decode_ms_per_token: float = 20.0,
+                 reply_tokens: int = 32):
+        self.host = host
+        self.port = port
+        self.slots = slots
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.slots)
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self._handle_chat)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Fake LLM server listening on {self.url}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @staticmethod
+    def count_tokens(payload: Dict[str, Any]) -> int:
+        # Rough estimate: one token per whitespace separated word.
+        tokens = 0
+        for message in payload.get("messages", []):
+            content = message.get("content", "")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+            tokens += len(content.split()) + 4
+        return tokens
+
+    def _max_tokens(self, payload: Dict[str, Any]) -> int:
+        limit = payload.get("max_tokens") or payload.get("n_predict")
+        return min(self.reply_tokens, limit) if limit else self.reply_tokens
+
+    async def _handle_chat(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.requests += 1
+        prompt_tokens = self.count_tokens(payload)
+        # A trailing assistant message is continued: only the rest of the reply is generated.
+        messages = payload.get("messages") or [{}]
+        continued = messages[-1].get("role") == "assistant"
+        remaining = self.reply_tokens - (len(messages[-1].get("content", "").split()) if continued else 0)
+        completion_tokens = min(remaining, self._max_tokens(payload))
+        finish_reason = "length" if completion_tokens < remaining else "stop"
+
+        async with self._slots:
+            prefill = prompt_tokens * self.prefill_ms_per_token / 1000
+            await asyncio.sleep(prefill)
+            if payload.get("stream"):
+                return await self._stream(request, completion_tokens, finish_reason)
+
+            decode = completion_tokens * self.decode_ms_per_token / 1000
+            await asyncio.sleep(decode)
+
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " " * continued + " ".join(["token"] * completion_tokens)},
+                "finish_reason": finish_reason
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            },
+            "timings": {
+                "prompt_n": prompt_tokens,
+                "prompt_ms": prefill * 1000,
+                "predicted_n": completion_tokens,
+                "predicted_ms": decode * 1000
+            }
+        })
+
+    async def _stream(self, request: web.Request, completion_tokens: int, finish_reason: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(completion_tokens):
+            await asyncio.sleep(self.decode_ms_per_token / 1000)
+            chunk = {"choices": [{"index": 0, "delta": {"content": "token "}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}
+        await response.write(f"data: {json.dumps(final)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
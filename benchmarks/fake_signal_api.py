@@ -0,0 +1,152 @@
+"""
+Stand-in for signal-cli-rest-api (https://github.com/bbernhard/signal-cli-rest-api) used by the benchmarks.
+Pushes synthetic envelopes over the receive websocket and records everything sent back.
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+from utils.logging_setup import logger
+
+
+class FakeSignalAPI:
+    def __init__(self, phone_number: str, host: str = "127.0.0.1", port: int = 0):
+        self.phone_number = phone_number
+        self.host = host
+        self.port = port
+        self.connected = asyncio.Event()
+        self.sent: List[Dict[str, Any]] = []
+        self.typing_requests = 0
+        # Inbound envelopes per account number
+        self._inbound: Dict[str, asyncio.Queue] = {}
+        self._replies: Dict[str, asyncio.Queue] = {}
+        self._attachments: Dict[str, bytes] = {}
+        self._websockets: List[web.WebSocketResponse] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/v1/receive/{number}", self._handle_receive)
+        app.router.add_post("/v2/send", self._handle_send)
+        app.router.add_get("/v1/attachments/{attachment_id}", self._handle_get_attachment)
+        app.router.add_post("/v1/attachments", self._handle_upload_attachment)
+        app.router.add_put("/v1/typing-indicator/{number}", self._handle_typing)
+        app.router.add_delete("/v1/typing-indicator/{number}", self._handle_typing)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Fake signal api listening on {self.address}")
+
+    async def stop(self) -> None:
+        for ws in list(self._websockets):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_attachment(self, data: bytes, attachment_id: Optional[str] = None) -> str:
+        attachment_id = attachment_id or uuid.uuid4().hex
+        self._attachments[attachment_id] = data
+        return attachment_id
+
+    def push_message(self, source: str, text: str, attachments: Optional[List[Dict[str, Any]]] = None,
+                     group_id: Optional[str] = None, account: Optional[str] = None) -> None:
+        envelope = self.build_envelope(source, text, attachments, group_id, account)
+        self._inbound_queue(envelope["account"]).put_nowait(json.dumps(envelope))
+
+    def push_raw(self, raw_message: str, account: Optional[str] = None) -> None:
+        self._inbound_queue(account or self.phone_number).put_nowait(raw_message)
+
+    def _inbound_queue(self, account: str) -> asyncio.Queue:
+        if account not in self._inbound:
+            self._inbound[account] = asyncio.Queue()
+        return self._inbound[account]
+
+    def build_envelope(self, source: str, text: str, attachments: Optional[List[Dict[str, Any]]] = None,
+                       group_id: Optional[str] = None, account: Optional[str] = None) -> Dict[str, Any]:
+        timestamp = int(time.time() * 1000)
+        data_message = {"timestamp": timestamp, "message": text}
+        if attachments:
+            data_message["attachments"] = attachments
+        if group_id:
+            data_message["groupInfo"] = {"groupId": group_id, "type": "DELIVER"}
+        return {
+            "envelope": {
+                "source": source,
+                "sourceNumber": source,
+                "sourceUuid": str(uuid.uuid5(uuid.NAMESPACE_OID, source)),
+                "timestamp": timestamp,
+                "serverReceivedTimestamp": timestamp,
+                "dataMessage": data_message
+            },
+            "account": account or self.phone_number
+        }
+
+    async def wait_for_reply(self, recipient: str) -> Dict[str, Any]:
+        return await self._reply_queue(recipient).get()
+
+    def _reply_queue(self, recipient: str) -> asyncio.Queue:
+        if recipient not in self._replies:
+            self._replies[recipient] = asyncio.Queue()
+        return self._replies[recipient]
+
+    async def _handle_receive(self, request: web.Request) -> web.StreamResponse:
+        ws = web.WebSocketResponse()
+        if not ws.can_prepare(request).ok:
+            # REST receive (catch-up after a reconnect): everything was already delivered over the websocket
+            return web.json_response([])
+        await ws.prepare(request)
+        self._websockets.append(ws)
+        self.connected.set()
+        # Reading is only needed to notice the client going away.
+        reader = asyncio.create_task(self._drain(ws))
+        try:
+            while not reader.done():
+                getter = asyncio.create_task(self._inbound_queue(request.match_info["number"]).get())
+                done, _ = await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    await ws.send_str(getter.result())
+                else:
+                    getter.cancel()
+        finally:
+            reader.cancel()
+            self._websockets.remove(ws)
+            self.connected.clear()
+        return ws
+
+    async def _drain(self, ws: web.WebSocketResponse) -> None:
+        async for _ in ws:
+            pass
+
+    async def _handle_send(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        payload["received_at"] = time.perf_counter()
+        self.sent.append(payload)
+        for recipient in payload.get("recipients", []):
+            self._reply_queue(recipient).put_nowait(payload)
+        return web.json_response({"timestamp": str(int(time.time() * 1000))}, status=201)
+
+    async def _handle_get_attachment(self, request: web.Request) -> web.Response:
+        data = self._attachments.get(request.match_info["attachment_id"])
+        if data is None:
+            return web.Response(status=404)
+        return web.Response(body=data, content_type="application/octet-stream")
+
+    async def _handle_upload_attachment(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        field = form.get("attachment")
+        data = field.file.read() if hasattr(field, "file") else bytes(field or b"")
+        return web.json_response({"id": self.add_attachment(data)}, status=201)
+
+    async def _handle_typing(self, request: web.Request) -> web.Response:
+        self.typing_requests += 1
+        return web.Response(status=204)
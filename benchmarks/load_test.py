@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark. Runs Application against local stand-ins for signal-cli-rest-api and the LLM server
+and drives it with N concurrent synthetic conversations.
+
+Run from the repository root:
+    python3 -m benchmarks.load_test --conversations 8 --messages 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Any, List
+
+from main import Application
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.fake_signal_api import FakeSignalAPI
+from workers.worker_pool import WorkerPool
+from config.config_manager import ConfigManager
+from utils.logging_setup import logger
+
+BOT_NUMBER = "+10000000000"
+
+
+def account_number(index: int) -> str:
+    return BOT_NUMBER if index == 0 else f"+1000000{index:04d}"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is kilobytes on linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def write_config(path: str, signal_api: FakeSignalAPI, llm: FakeLLMServer, args: argparse.Namespace,
+                 reset_memory_word: str = "") -> None:
+    config = {
+        "signal_service": signal_api.address,
+        "phone_number": signal_api.phone_number,
+        "has_memory": args.memory,
+        "save_memory": False,
+        "save_attachments": False,
+        "memory_file": "benchmark_history.json",
+        "llm_service_provider": args.provider,
+        "llm_service_url": llm.url,
+        "llm_api_key": "",
+        "llm_model_options": {"system_prompt": "You are a benchmark.", "model": "fake", "keep_alive": 5},
+        "reset_memory_word": reset_memory_word,
+        "capture_file": getattr(args, "capture", ""),
+        "llm_concurrency": getattr(args, "llm_concurrency", 0),
+        "workers": getattr(args, "workers", 1),
+        "llm_chunk_tokens": getattr(args, "chunk_tokens", 0),
+        "llm_max_continuations": getattr(args, "max_continuations", 8),
+        # One message per reply (or chunk), so every send matches one request
+        "max_message_length": 0
+    }
+    if getattr(args, "accounts", 1) > 1:
+        config["accounts"] = [{"phone_number": account_number(n)} for n in range(args.accounts)]
+    with open(path, "w") as f:
+        json.dump(config, f)
+
+
+async def run_conversation(signal_api: FakeSignalAPI, source: str, account: str, args: argparse.Namespace,
+                           latencies: List[float], attachment: Dict[str, Any]) -> None:
+    # Replies generated in chunks arrive as several messages. Latency is measured to the first one.
+    parts = min(math.ceil(args.reply_tokens / args.chunk_tokens), 1 + args.max_continuations) if args.chunk_tokens else 1
+    for i in range(args.messages):
+        text = " ".join(["word"] * args.prompt_words) + f" ({i})"
+        start = time.perf_counter()
+        signal_api.push_message(source, text, [attachment] if attachment else None, account=account)
+        await asyncio.wait_for(signal_api.wait_for_reply(source), timeout=args.timeout)
+        latencies.append(time.perf_counter() - start)
+        for _ in range(parts - 1):
+            await asyncio.wait_for(signal_api.wait_for_reply(source), timeout=args.timeout)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    signal_api = FakeSignalAPI(BOT_NUMBER)
+    llm = FakeLLMServer(
+        slots=args.slots,
+        prefill_ms_per_token=args.prefill_ms,
+        decode_ms_per_token=args.decode_ms,
+        reply_tokens=args.reply_tokens
+    )
+    await signal_api.start()
+    await llm.start()
+
+    attachment = None
+    if args.attachment_bytes:
+        attachment_id = signal_api.add_attachment(os.urandom(args.attachment_bytes))
+        attachment = {"id": attachment_id, "contentType": "image/jpeg", "filename": "bench.jpg",
+                      "size": args.attachment_bytes}
+
+    config_fd, config_path = tempfile.mkstemp(suffix=".json")
+    os.close(config_fd)
+    write_config(config_path, signal_api, llm, args)
+
+    if args.workers > 1:
+        app = WorkerPool(ConfigManager(config_path), config_path, api_key="", workers=args.workers)
+    else:
+        app = Application(api_key="", config_path=config_path)
+    app_task = asyncio.create_task(app.run())
+
+    latencies: List[float] = []
+    try:
+        await asyncio.wait_for(signal_api.connected.wait(), timeout=10)
+        if args.tracemalloc:
+            tracemalloc.start()
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            run_conversation(signal_api, f"+1555{n:07d}", account_number(n % args.accounts), args, latencies, attachment)
+            for n in range(args.conversations)
+        ])
+        elapsed = time.perf_counter() - start
+        heap_mb = None
+        if args.tracemalloc:
+            heap_mb = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+            tracemalloc.stop()
+    finally:
+        app_task.cancel()
+        try:
+            await app_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await llm.stop()
+        await signal_api.stop()
+        os.remove(config_path)
+
+    result = {
+        "conversations": args.conversations,
+        "messages": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_rss_growth_mb": round(max_rss_mb() - rss_before, 1),
+        "llm_requests": llm.requests
+    }
+    if heap_mb is not None:
+        result["python_heap_growth_mb"] = round(heap_mb, 1)
+    return result
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="SignalLLM end-to-end load benchmark")
+    parser.add_argument("--conversations", type=int, default=8, help="Concurrent synthetic conversations")
+    parser.add_argument("--messages", type=int, default=10, help="Messages per conversation")
+    parser.add_argument("--prompt-words", type=int, default=20, help="Words per user message")
+    parser.add_argument("--reply-tokens", type=int, default=32, help="Tokens per LLM reply")
+    parser.add_argument("--prefill-ms", type=float, default=0.2, help="Simulated prefill time per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=2.0, help="Simulated decode time per reply token")
+    parser.add_argument("--slots", type=int, default=1, help="Parallel slots of the fake LLM server")
+    parser.add_argument("--attachment-bytes", type=int, default=0, help="Attach an image of this size to every message")
+    parser.add_argument("--provider", choices=["ollama", "llamacpp"], default="llamacpp")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Run with has_memory off")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for a single reply")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report python heap growth (slower)")
+    parser.add_argument("--accounts", type=int, default=1, help="Serve this many bot accounts")
+    parser.add_argument("--llm-concurrency", type=int, default=0, help="Limit concurrent LLM requests (0: no limit)")
+    parser.add_argument("--chunk-tokens", type=int, default=0, help="Generate replies in chunks of this many tokens")
+    parser.add_argument("--max-continuations", type=int, default=8, help="Chunks generated after the first, at most")
+    parser.add_argument("--workers", type=int, default=1, help="Run with this many worker processes")
+    parser.add_argument("--capture", default="", help="Record the generated traffic to files/captures/<name>")
+    parser.add_argument("--json", action="store_true", help="Print the result as json")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    logger.setLevel(args.log_level)
+    result = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
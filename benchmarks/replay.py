@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Replays a traffic capture (see "capture_file" in README.md) through Application against the local stand-ins
+for signal-cli-rest-api and the LLM server.
+
+Run from the repository root:
+    python3 -m benchmarks.replay files/captures/capture.jsonl --speed 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict, deque
+from typing import Dict, Any, List, Deque
+
+from main import Application
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.fake_signal_api import FakeSignalAPI
+from benchmarks.load_test import write_config, percentile, max_rss_mb
+from utils.logging_setup import logger
+
+
+def load_capture(capture_file: str) -> Dict[str, Any]:
+    capture = {"phone_number": None, "commands": [], "inbound": [], "attachments": {}}
+    # Each restart of the recorder appends a new header and restarts its clock. Segments are laid back to back.
+    offset = 0.0
+    last_t = 0.0
+    with open(capture_file, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.get("kind")
+            if kind == "header":
+                capture["phone_number"] = record["phone_number"]
+                capture["commands"] = record.get("commands", [])
+                offset = last_t
+            elif kind == "inbound":
+                last_t = offset + record["t"]
+                capture["inbound"].append({"seq": record["seq"], "t": last_t, "raw": record["raw"]})
+            elif kind == "attachment":
+                capture["attachments"][record["id"]] = record["sha256"]
+            elif kind == "llm_request":
+                # Remember the reply on the inbound entry it belongs to.
+                for inbound in reversed(capture["inbound"]):
+                    if inbound["seq"] == record["seq"]:
+                        inbound["recipient"] = record["recipient"]
+                        break
+    return capture
+
+
+async def replay(args: argparse.Namespace) -> Dict[str, Any]:
+    capture = load_capture(args.capture_file)
+    if not capture["phone_number"]:
+        raise ValueError(f"No header found in {args.capture_file}")
+
+    signal_api = FakeSignalAPI(capture["phone_number"])
+    llm = FakeLLMServer(
+        slots=args.slots,
+        prefill_ms_per_token=args.prefill_ms,
+        decode_ms_per_token=args.decode_ms,
+        reply_tokens=args.reply_tokens
+    )
+    await signal_api.start()
+    await llm.start()
+
+    blob_path = os.path.join(os.path.dirname(os.path.abspath(args.capture_file)), "blobs")
+    for attachment_id, digest in capture["attachments"].items():
+        try:
+            with open(os.path.join(blob_path, digest), "rb") as f:
+                signal_api.add_attachment(f.read(), attachment_id)
+        except FileNotFoundError:
+            logger.warning(f"Missing attachment blob {digest}")
+
+    config_fd, config_path = tempfile.mkstemp(suffix=".json")
+    os.close(config_fd)
+    write_config(config_path, signal_api, llm, args,
+                 reset_memory_word=capture["commands"][0] if capture["commands"] else "")
+
+    app = Application(api_key="", config_path=config_path)
+    app_task = asyncio.create_task(app.run())
+
+    pending: Dict[str, Deque[float]] = defaultdict(deque)
+    latencies: List[float] = []
+    expected = sum(1 for inbound in capture["inbound"] if "recipient" in inbound)
+
+    async def collect(recipient: str) -> None:
+        while True:
+            await signal_api.wait_for_reply(recipient)
+            if pending[recipient]:
+                latencies.append(time.perf_counter() - pending[recipient].popleft())
+
+    collectors = {}
+    try:
+        await asyncio.wait_for(signal_api.connected.wait(), timeout=10)
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        for inbound in capture["inbound"]:
+            if args.speed > 0:
+                delay = inbound["t"] / args.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            recipient = inbound.get("recipient")
+            if recipient:
+                pending[recipient].append(time.perf_counter())
+                if recipient not in collectors:
+                    collectors[recipient] = asyncio.create_task(collect(recipient))
+            signal_api.push_raw(inbound["raw"])
+
+        deadline = time.perf_counter() + args.timeout
+        while len(latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        for task in collectors.values():
+            task.cancel()
+        app_task.cancel()
+        try:
+            await app_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await llm.stop()
+        await signal_api.stop()
+        os.remove(config_path)
+
+    return {
+        "inbound": len(capture["inbound"]),
+        "expected_replies": expected,
+        "replies": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_rss_growth_mb": round(max_rss_mb() - rss_before, 1),
+        "llm_requests": llm.requests
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay a SignalLLM traffic capture against stand-in backends")
+    parser.add_argument("capture_file")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed factor. 1 keeps original timing, 0 sends as fast as possible")
+    parser.add_argument("--reply-tokens", type=int, default=32, help="Tokens per LLM reply")
+    parser.add_argument("--prefill-ms", type=float, default=0.2, help="Simulated prefill time per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=2.0, help="Simulated decode time per reply token")
+    parser.add_argument("--slots", type=int, default=1, help="Parallel slots of the fake LLM server")
+    parser.add_argument("--provider", choices=["ollama", "llamacpp"], default="ollama")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Run with has_memory off")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for outstanding replies")
+    parser.add_argument("--json", action="store_true", help="Print the result as json")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    logger.setLevel(args.log_level)
+    result = asyncio.run(replay(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ from clients.llm_client import LLMClient
 from clients.http_client import HTTPClient
 from clients.websocket_client import WebsocketClient
 from clients.attachment_manager import AttachmentManager
+from clients.capture_recorder import CaptureRecorder
+from clients.outbound_pipeline import OutboundPipeline
+from clients.group_gate import GroupGate
+from clients.fair_slots import FairSlots
 
 __all__ = [
     "SignalClient",
@@ -11,5 +15,9 @@ __all__ = [
     "LLMClient",
     "HTTPClient",
     "WebsocketClient",
-    "AttachmentManager"
+    "AttachmentManager",
+    "CaptureRecorder",
+    "OutboundPipeline",
+    "GroupGate",
+    "FairSlots"
 ]
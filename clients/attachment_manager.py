@@ -1,7 +1,8 @@
+import asyncio
 import base64
 import aiofiles
 import aiohttp
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 from clients.http_client import HTTPClient
 from utils.logging_setup import logger
@@ -26,32 +27,45 @@ class AttachmentManager:
         uri = f"{self.attachment_base_url}/{attachment_id}"
         
         try:
-            content = await HTTPClient.get(uri)
+            content = await HTTPClient.get(uri, call_type="attachment")
             if content:
                 return base64.b64encode(content).decode("utf-8")
             return None
         except Exception as e:
-            logger.error(f"Error retrieving attachment: {e}")
+            logger.error("Error retrieving attachment: %s", e)
             return None
     
+    @staticmethod
+    def as_data_uri(attachment: Dict[str, Any]) -> str:
+        # Inline form accepted by /v2/send in "base64_attachments"; the data is already base64, so no decoding.
+        content_type = attachment.get("content_type", "image/jpeg")
+        filename = attachment.get("filename", "image.jpg")
+        return f"data:{content_type};filename={filename};base64,{attachment['data']}"
+
+    async def upload_attachments(self, attachments: List[Dict[str, Any]]) -> List[str]:
+        attachment_ids = await asyncio.gather(*[self.upload_attachment(a) for a in attachments])
+        return [attachment_id for attachment_id in attachment_ids if attachment_id]
+
     async def upload_attachment(self, attachment: Dict[str, Any]) -> Optional[str]:
         try:
             binary_data = base64.b64decode(attachment["data"])
             
-            form_data = aiohttp.FormData()
-            form_data.add_field(
-                "attachment",
-                binary_data,
-                filename=attachment.get("filename", "image.jpg"),
-                content_type=attachment.get("content_type", "image/jpeg")
-            )
+            def build_form() -> aiohttp.FormData:
+                form_data = aiohttp.FormData()
+                form_data.add_field(
+                    "attachment",
+                    binary_data,
+                    filename=attachment.get("filename", "image.jpg"),
+                    content_type=attachment.get("content_type", "image/jpeg")
+                )
+                return form_data
             
-            response = await HTTPClient.post(self.attachment_base_url, form_data=form_data)
+            response = await HTTPClient.post(self.attachment_base_url, form_factory=build_form, call_type="attachment")
             if response and "id" in response:
                 return response["id"]
             return None
         except Exception as e:
-            logger.error(f"Error uploading attachment: {e}")
+            logger.error("Error uploading attachment: %s", e)
             return None
 
     async def _save_attachment(self, attachment:Dict[str, Any], data) -> None:
@@ -63,4 +77,4 @@ class AttachmentManager:
                     await out.write(binary_data)
                     await out.flush()
             except Exception as e:
-                logger.error(f"Failed to save attachment: {e}")
\ No newline at end of file
+                logger.error("Failed to save attachment: %s", e)
\ No newline at end of file
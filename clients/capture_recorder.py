@@ -0,0 +1,128 @@
+import asyncio
+import base64
+import contextvars
+import copy
+import hashlib
+import json
+import os
+import time
+import aiofiles
+from typing import Dict, Any, List, Optional
+
+from utils.logging_setup import logger
+
+
+# Sequence number of the inbound envelope currently being handled.
+_current_seq: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("current_capture_seq", default=None)
+
+
+class CaptureRecorder:
+    def __init__(self, capture_file: str, phone_number: str, commands: Optional[List[str]] = None,
+                 capture_path: str = "./files/captures/"):
+        self.capture_file = f"{capture_path}{capture_file}"
+        self.blob_path = f"{capture_path}blobs/"
+        self.phone_number = phone_number
+        self.commands = commands or []
+        self._started = time.time()
+        self._seq = 0
+        self._header_written = False
+        self._lock = asyncio.Lock()
+        os.makedirs(self.blob_path, exist_ok=True)
+        logger.info("Capturing traffic to %s", self.capture_file)
+
+    async def record_inbound(self, raw_message: str) -> int:
+        self._seq += 1
+        _current_seq.set(self._seq)
+        wall = self._received_at(raw_message)
+        await self._append({
+            "kind": "inbound",
+            "seq": self._seq,
+            # Envelopes queued before the recorder started are replayed right away
+            "t": round(max(0.0, wall - self._started), 6),
+            "wall": wall,
+            "raw": raw_message
+        })
+        return self._seq
+
+    @staticmethod
+    def _received_at(raw_message: str) -> float:
+        # When the server received the envelope, not when it was handled: handling waits on the
+        # previous messages, so its time would record our own backlog instead of the traffic.
+        try:
+            envelope = json.loads(raw_message).get("envelope", {})
+            received = envelope.get("serverReceivedTimestamp") or envelope.get("timestamp")
+            if received:
+                return received / 1000
+        except (ValueError, AttributeError):
+            pass
+        return time.time()
+
+    async def record_attachment(self, attachment_id: str, data: str, content_type: str) -> None:
+        try:
+            binary_data = base64.b64decode(data)
+            digest = await self._store_blob(binary_data)
+            await self._append({
+                "kind": "attachment",
+                "seq": _current_seq.get(),
+                "id": attachment_id,
+                "sha256": digest,
+                "content_type": content_type,
+                "size": len(binary_data)
+            })
+        except Exception as e:
+            logger.error("Failed to capture attachment: %s", e)
+
+    async def record_llm_request(self, recipient: str, body: bytes) -> None:
+        try:
+            payload = json.loads(body)
+            await self._append({
+                "kind": "llm_request",
+                "seq": _current_seq.get(),
+                "t": self._elapsed(),
+                "recipient": recipient,
+                "payload": await self._strip_inline_data(payload)
+            })
+        except Exception as e:
+            logger.error("Failed to capture LLM request: %s", e)
+
+    def _elapsed(self) -> float:
+        return round(time.time() - self._started, 6)
+
+    async def _strip_inline_data(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Images are inlined as base64 data urls. Keep a blob reference instead of the data.
+        if not any(isinstance(m.get("content"), list) for m in payload.get("messages", [])):
+            return payload
+        payload = copy.deepcopy(payload)
+        for message in payload["messages"]:
+            if not isinstance(message.get("content"), list):
+                continue
+            for part in message["content"]:
+                url = part.get("image_url", {}).get("url", "") if part.get("type") == "image_url" else ""
+                if url.startswith("data:") and ";base64," in url:
+                    digest = await self._store_blob(base64.b64decode(url.split(";base64,", 1)[1]))
+                    part["image_url"]["url"] = f"sha256:{digest}"
+        return payload
+
+    async def _store_blob(self, binary_data: bytes) -> str:
+        digest = hashlib.sha256(binary_data).hexdigest()
+        filepath = f"{self.blob_path}{digest}"
+        if not os.path.exists(filepath):
+            async with aiofiles.open(filepath, "wb") as out:
+                await out.write(binary_data)
+        return digest
+
+    async def _append(self, record: Dict[str, Any]) -> None:
+        async with self._lock:
+            try:
+                async with aiofiles.open(self.capture_file, "a") as out:
+                    if not self._header_written:
+                        await out.write(json.dumps({
+                            "kind": "header",
+                            "phone_number": self.phone_number,
+                            "commands": self.commands,
+                            "started": self._started
+                        }) + "\n")
+                        self._header_written = True
+                    await out.write(json.dumps(record) + "\n")
+            except Exception as e:
+                logger.error("Failed to write capture: %s", e)
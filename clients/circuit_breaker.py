@@ -0,0 +1,60 @@
+import time
+from utils.logging_setup import logger
+from utils.metrics import metrics
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._rejected = metrics.counter(
+            "signalllm_circuit_rejected_total", "Requests failed fast by an open circuit breaker.", ("name",)
+        )
+        self._opened = metrics.counter(
+            "signalllm_circuit_opened_total", "Times a circuit breaker opened.", ("name",)
+        )
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            # Let a single request through to probe whether the backend has recovered.
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # A probe that never reported back (e.g. cancelled) must not keep the circuit half open forever.
+        probe_stale = time.monotonic() - self._probe_started >= self.recovery_timeout
+        if self.state == self.HALF_OPEN and (not self._probe_in_flight or probe_stale):
+            self._probe_in_flight = True
+            self._probe_started = time.monotonic()
+            logger.info("Circuit %s half open, probing backend", self.name)
+            return True
+        self._rejected.inc(name=self.name)
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Circuit %s closed, backend recovered", self.name)
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit %s open after %s failure(s), failing fast for %s s",
+                               self.name, self._failures, self.recovery_timeout)
+                self._opened.inc(name=self.name)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
@@ -0,0 +1,74 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Dict, Hashable
+
+
+class FairSlots:
+    # Limits concurrent LLM requests like a semaphore, but waiters are grouped by conversation and the
+    # conversation served least recently goes first. A long answer generated in chunks re-queues each
+    # chunk, so it takes turns with everybody else instead of holding on to the backend.
+    def __init__(self, limit: int, remembered: int = 1000):
+        self.limit = limit
+        self.remembered = remembered
+        self._in_use = 0
+        self._waiters: Dict[Hashable, deque] = {}
+        # Conversations in the order they were last served, least recent first
+        self._served: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def _mark_served(self, key: Hashable) -> None:
+        self._served.pop(key, None)
+        self._served[key] = None
+        if len(self._served) > self.remembered:
+            self._served.popitem(last=False)
+
+    def _next_key(self) -> Hashable:
+        # Conversations never served (or long forgotten) first, then least recently served
+        for key in self._waiters:
+            if key not in self._served:
+                return key
+        for key in self._served:
+            if key in self._waiters:
+                return key
+
+    async def acquire(self, key: Hashable) -> None:
+        if self._in_use < self.limit and not self._waiters:
+            self._in_use += 1
+            self._mark_served(key)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled right after being handed a slot
+                self.release()
+            else:
+                queue = self._waiters.get(key)
+                if queue and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._waiters[key]
+            raise
+
+    def resize(self, limit: int) -> None:
+        # Requests already holding a slot keep it. A lower limit takes effect as they finish.
+        self.limit = limit
+        self._wake()
+
+    def release(self) -> None:
+        self._in_use -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._in_use < self.limit and self._waiters:
+            key = self._next_key()
+            queue = self._waiters[key]
+            waiter = queue.popleft()
+            if not queue:
+                del self._waiters[key]
+            if waiter.done():
+                continue
+            self._in_use += 1
+            self._mark_served(key)
+            waiter.set_result(None)
@@ -0,0 +1,71 @@
+import random
+from collections import deque
+from typing import Dict, Any, Optional
+
+from utils.metrics import metrics
+
+
+group_messages_total = metrics.counter(
+    "signalllm_group_messages_total", "Group messages, by whether they were addressed to the bot.", ("decision",)
+)
+
+
+class GroupGate:
+    # Decides from the envelope alone whether a group message is meant for the bot, so chatter never
+    # costs an attachment download, a memory update or an LLM request.
+    # Policies are keyed by group id, "default" applies to all other groups:
+    #   mention (true):  the bot is @mentioned
+    #   quote (true):    the message quotes one of the bot's messages
+    #   prefix (""):     the text starts with this prefix, which is removed
+    #   sample_rate (0): answer this fraction of all other messages
+    #   remember_unaddressed (false): keep the last context_lines (20) unaddressed lines and pass them
+    #                                 along with the next addressed message
+    def __init__(self, phone_number: str, triggers: Dict[str, Dict[str, Any]], account_uuid: Optional[str] = None):
+        self.phone_number = phone_number
+        self.account_uuid = account_uuid
+        self.triggers = triggers
+        self.default = triggers.get("default", {})
+        self._context: Dict[str, deque] = {}
+
+    def policy(self, group_id: str) -> Dict[str, Any]:
+        return self.triggers.get(group_id, self.default)
+
+    def _is_self(self, number: Optional[str], uuid: Optional[str]) -> bool:
+        return bool((number and number == self.phone_number) or (uuid and uuid == self.account_uuid))
+
+    def addressed_text(self, group_id: str, message_data: Dict[str, Any], text: str) -> Optional[str]:
+        # Returns the prompt text when the bot is addressed, None otherwise.
+        policy = self.policy(group_id)
+        addressed = False
+
+        prefix = policy.get("prefix", "")
+        if prefix and text.startswith(prefix):
+            text = text[len(prefix):].lstrip()
+            addressed = True
+        elif policy.get("mention", True) and any(
+            self._is_self(mention.get("number"), mention.get("uuid"))
+            for mention in message_data.get("mentions") or []
+        ):
+            addressed = True
+        elif policy.get("quote", True) and message_data.get("quote") and self._is_self(
+            message_data["quote"].get("authorNumber") or message_data["quote"].get("author"),
+            message_data["quote"].get("authorUuid")
+        ):
+            addressed = True
+        elif random.random() < policy.get("sample_rate", 0):
+            addressed = True
+
+        group_messages_total.inc(decision="addressed" if addressed else "ignored")
+        return text if addressed else None
+
+    def remember(self, group_id: str, sender: str, text: str) -> None:
+        policy = self.policy(group_id)
+        if not policy.get("remember_unaddressed") or not text:
+            return
+        if group_id not in self._context:
+            self._context[group_id] = deque(maxlen=policy.get("context_lines", 20))
+        self._context[group_id].append(f"{sender}: {text}")
+
+    def take_context(self, group_id: str) -> str:
+        lines = self._context.pop(group_id, None)
+        return "\n".join(lines) if lines else ""
@@ -1,106 +1,250 @@
+import asyncio
+import contextlib
 import json
-import traceback
+import random
 import aiohttp
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Optional, Tuple
 from utils.logging_setup import logger
+from utils.metrics import metrics
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+http_retries_total = metrics.counter(
+    "signalllm_http_retries_total", "HTTP requests retried, by call type.", ("call_type",)
+)
 
 
 class HTTPClient:
+    # Timeouts and retries per call type: "signal" (send, typing), "attachment" and "llm".
+    default_timeouts: Dict[str, aiohttp.ClientTimeout] = {
+        "signal": aiohttp.ClientTimeout(total=None, connect=5, sock_read=30),
+        "attachment": aiohttp.ClientTimeout(total=None, connect=5, sock_read=120),
+        "llm": aiohttp.ClientTimeout(total=None, connect=10, sock_read=600)
+    }
+    default_retries: Dict[str, int] = {"signal": 3, "attachment": 3, "llm": 0}
+    timeouts: Dict[str, aiohttp.ClientTimeout] = dict(default_timeouts)
+    retries: Dict[str, int] = dict(default_retries)
+    retry_base_delay = 0.5
+    retry_max_delay = 8.0
+    # Long-lived session of this process, so connections are pooled and reused (see open_session).
+    session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def build_settings(cls, timeouts: Optional[Dict[str, Dict[str, float]]] = None,
+                       retries: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, aiohttp.ClientTimeout], Dict[str, int]]:
+        # Overrides are merged into the defaults, settings left out keep their default value.
+        built_timeouts = dict(cls.default_timeouts)
+        for call_type, values in (timeouts or {}).items():
+            default = built_timeouts.get(call_type, aiohttp.ClientTimeout(total=None))
+            built_timeouts[call_type] = aiohttp.ClientTimeout(
+                total=values.get("total", default.total),
+                connect=values.get("connect", default.connect),
+                sock_read=values.get("read", default.sock_read)
+            )
+        return built_timeouts, {**cls.default_retries, **(retries or {})}
+
+    @classmethod
+    def apply_settings(cls, settings: Tuple[Dict[str, aiohttp.ClientTimeout], Dict[str, int]]) -> None:
+        cls.timeouts, cls.retries = settings
+
+    @classmethod
+    def configure(cls, timeouts: Optional[Dict[str, Dict[str, float]]] = None,
+                  retries: Optional[Dict[str, int]] = None) -> None:
+        cls.apply_settings(cls.build_settings(timeouts, retries))
+
+    @classmethod
+    def open_session(cls) -> None:
+        # Must be called from a running event loop. Calls made without a session use a new one each time.
+        if cls.session is None or cls.session.closed:
+            cls.session = aiohttp.ClientSession()
+
+    @classmethod
+    async def close_session(cls) -> None:
+        if cls.session is not None:
+            await cls.session.close()
+            cls.session = None
+
+    @classmethod
+    @contextlib.asynccontextmanager
+    async def _session(cls):
+        if cls.session is not None and not cls.session.closed:
+            yield cls.session
+        else:
+            async with aiohttp.ClientSession() as session:
+                yield session
+
+    @classmethod
+    def _retry_delay(cls, attempt: int) -> float:
+        # Full jitter so retries from many tasks do not arrive in lockstep.
+        return random.uniform(0, min(cls.retry_max_delay, cls.retry_base_delay * 2 ** attempt))
+
+    @classmethod
+    async def _should_retry(cls, call_type: str, attempt: int, idempotent: bool,
+                            error: Optional[BaseException] = None, status: Optional[int] = None) -> bool:
+        if attempt >= cls.retries.get(call_type, 0):
+            return False
+        if error is not None:
+            # A request that never reached the server is always safe to repeat.
+            if not idempotent and not isinstance(error, aiohttp.ClientConnectorError):
+                return False
+        elif not idempotent or status not in RETRY_STATUSES:
+            return False
+        http_retries_total.inc(call_type=call_type)
+        delay = cls._retry_delay(attempt)
+        logger.warning("Retrying %s request in %.2f s (attempt %s)", call_type, delay, attempt + 1)
+        await asyncio.sleep(delay)
+        return True
+
     @staticmethod
     async def post(url: str, json_data: Dict[str, Any] = None, headers: Dict[str, str] = None,
-                  form_data: aiohttp.FormData = None) -> Optional[Dict[str, Any]]:
-        try:
-            async with aiohttp.ClientSession() as session:
-                data = form_data if form_data else json_data
-                method = session.post
-                kwargs = {'data': data} if form_data else {'json': data}
-                if headers:
-                    kwargs['headers'] = headers
-                
-                async with method(url, **kwargs) as resp:
-                    if resp.status in [200, 201, 204]:
-                        if resp.content_type == 'application/json':
-                            return await resp.json()
-                        else:
-                            return {'status': resp.status, 'text': await resp.text()}
-                    else:
-                        error_text = await resp.text()
-                        logger.error(f"HTTP error: {resp.status} - {error_text}")
-                        return None
-        except aiohttp.ClientError as e:
-            logger.error(f"HTTP client error: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error in HTTP request: {e}")
-            logger.debug(traceback.format_exc())
-            return None
-    
+                  form_factory: Callable[[], aiohttp.FormData] = None, call_type: str = "signal",
+                  data: bytes = None) -> Optional[Dict[str, Any]]:
+        result, _ = await HTTPClient.post_with_status(url, json_data, headers, form_factory, call_type, data)
+        return result
+
     @staticmethod
-    async def get(url: str, headers: Dict[str, str] = None) -> Optional[Any]:
-        try:
-            async with aiohttp.ClientSession() as session:
-                kwargs = {}
-                if headers:
-                    kwargs['headers'] = headers
-                
-                async with session.get(url, **kwargs) as resp:
-                    if resp.status == 200:
-                        return await resp.read()
+    async def post_with_status(url: str, json_data: Dict[str, Any] = None, headers: Dict[str, str] = None,
+                               form_factory: Callable[[], aiohttp.FormData] = None, call_type: str = "signal",
+                               data: bytes = None) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        # Like post, also returning the response status (None when no response was received).
+        # data is an already serialized body, sent as is (set Content-Type in headers).
+        # A FormData can only be sent once, so forms are passed as a factory and rebuilt for every attempt.
+        attempt = 0
+        while True:
+            try:
+                async with HTTPClient._session() as session:
+                    method = session.post
+                    if data is not None:
+                        kwargs = {'data': data}
+                    elif form_factory:
+                        kwargs = {'data': form_factory()}
                     else:
-                        logger.error(f"HTTP GET error: {resp.status}")
-                        return None
-        except aiohttp.ClientError as e:
-            logger.error(f"HTTP client error in GET request: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error in GET request: {e}")
-            logger.debug(traceback.format_exc())
-            return None
-    
+                        kwargs = {'json': json_data}
+                    if headers:
+                        kwargs['headers'] = headers
+                    if call_type in HTTPClient.timeouts:
+                        kwargs['timeout'] = HTTPClient.timeouts[call_type]
+
+                    async with method(url, **kwargs) as resp:
+                        if resp.status in [200, 201, 204]:
+                            if resp.content_type == 'application/json':
+                                return await resp.json(), resp.status
+                            else:
+                                return {'status': resp.status, 'text': await resp.text()}, resp.status
+                        else:
+                            error_text = await resp.text()
+                            logger.error("HTTP error: %s - %s", resp.status, error_text)
+                            return None, resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error("HTTP client error: %r", e)
+                if await HTTPClient._should_retry(call_type, attempt, idempotent=False, error=e):
+                    attempt += 1
+                    continue
+                return None, None
+            except Exception as e:
+                logger.error("Unexpected error in HTTP request: %s", e)
+                logger.debug("Traceback:", exc_info=True)
+                return None, None
+
     @staticmethod
-    async def put(url: str, json_data: Dict[str, Any], headers: Dict[str, str] = None) -> bool:
-        try:
-            async with aiohttp.ClientSession() as session:
-                kwargs = {'json': json_data}
-                if headers:
-                    kwargs['headers'] = headers
-                
-                async with session.put(url, **kwargs) as resp:
-                    if resp.status in [200, 201, 204]:
-                        return True
-                    else:
-                        error_text = await resp.text()
-                        logger.error(f"HTTP PUT error: {resp.status} - {error_text}")
-                        return False
-        except aiohttp.ClientError as e:
-            logger.error(f"HTTP client error in PUT request: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error in PUT request: {e}")
-            logger.debug(traceback.format_exc())
-            return False
-    
+    async def get(url: str, headers: Dict[str, str] = None, call_type: str = "signal") -> Optional[Any]:
+        attempt = 0
+        while True:
+            try:
+                async with HTTPClient._session() as session:
+                    kwargs = {}
+                    if headers:
+                        kwargs['headers'] = headers
+                    if call_type in HTTPClient.timeouts:
+                        kwargs['timeout'] = HTTPClient.timeouts[call_type]
+
+                    async with session.get(url, **kwargs) as resp:
+                        if resp.status == 200:
+                            return await resp.read()
+                        else:
+                            logger.error("HTTP GET error: %s", resp.status)
+                            if await HTTPClient._should_retry(call_type, attempt, idempotent=True, status=resp.status):
+                                attempt += 1
+                                continue
+                            return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error("HTTP client error in GET request: %r", e)
+                if await HTTPClient._should_retry(call_type, attempt, idempotent=True, error=e):
+                    attempt += 1
+                    continue
+                return None
+            except Exception as e:
+                logger.error("Unexpected error in GET request: %s", e)
+                logger.debug("Traceback:", exc_info=True)
+                return None
+
     @staticmethod
-    async def delete(url: str, json_data: Dict[str, Any] = None, headers: Dict[str, str] = None) -> bool:
-        try:
-            async with aiohttp.ClientSession() as session:
-                kwargs = {}
-                if json_data:
-                    kwargs['json'] = json_data
-                if headers:
-                    kwargs['headers'] = headers
-                
-                async with session.delete(url, **kwargs) as resp:
-                    if resp.status in [200, 202, 204]:
-                        return True
-                    else:
-                        error_text = await resp.text()
-                        logger.error(f"HTTP DELETE error: {resp.status} - {error_text}")
-                        return False
-        except aiohttp.ClientError as e:
-            logger.error(f"HTTP client error in DELETE request: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error in DELETE request: {e}")
-            logger.debug(traceback.format_exc())
-            return False
+    async def put(url: str, json_data: Dict[str, Any], headers: Dict[str, str] = None,
+                  call_type: str = "signal") -> bool:
+        attempt = 0
+        while True:
+            try:
+                async with HTTPClient._session() as session:
+                    kwargs = {'json': json_data}
+                    if headers:
+                        kwargs['headers'] = headers
+                    if call_type in HTTPClient.timeouts:
+                        kwargs['timeout'] = HTTPClient.timeouts[call_type]
+
+                    async with session.put(url, **kwargs) as resp:
+                        if resp.status in [200, 201, 204]:
+                            return True
+                        else:
+                            error_text = await resp.text()
+                            logger.error("HTTP PUT error: %s - %s", resp.status, error_text)
+                            if await HTTPClient._should_retry(call_type, attempt, idempotent=True, status=resp.status):
+                                attempt += 1
+                                continue
+                            return False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error("HTTP client error in PUT request: %r", e)
+                if await HTTPClient._should_retry(call_type, attempt, idempotent=True, error=e):
+                    attempt += 1
+                    continue
+                return False
+            except Exception as e:
+                logger.error("Unexpected error in PUT request: %s", e)
+                logger.debug("Traceback:", exc_info=True)
+                return False
+
+    @staticmethod
+    async def delete(url: str, json_data: Dict[str, Any] = None, headers: Dict[str, str] = None,
+                     call_type: str = "signal") -> bool:
+        attempt = 0
+        while True:
+            try:
+                async with HTTPClient._session() as session:
+                    kwargs = {}
+                    if json_data:
+                        kwargs['json'] = json_data
+                    if headers:
+                        kwargs['headers'] = headers
+                    if call_type in HTTPClient.timeouts:
+                        kwargs['timeout'] = HTTPClient.timeouts[call_type]
+
+                    async with session.delete(url, **kwargs) as resp:
+                        if resp.status in [200, 202, 204]:
+                            return True
+                        else:
+                            error_text = await resp.text()
+                            logger.error("HTTP DELETE error: %s - %s", resp.status, error_text)
+                            if await HTTPClient._should_retry(call_type, attempt, idempotent=True, status=resp.status):
+                                attempt += 1
+                                continue
+                            return False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error("HTTP client error in DELETE request: %r", e)
+                if await HTTPClient._should_retry(call_type, attempt, idempotent=True, error=e):
+                    attempt += 1
+                    continue
+                return False
+            except Exception as e:
+                logger.error("Unexpected error in DELETE request: %s", e)
+                logger.debug("Traceback:", exc_info=True)
+                return False
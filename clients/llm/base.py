@@ -1,10 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional
 
+from memory.memory_manager import MemoryMessage
+
 
 class LLMServiceAdapter(ABC):
     @abstractmethod
-    def prepare_payload(self, memory: List[Dict[str, Any]], attachments: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    def prepare_payload(self, memory: List[MemoryMessage], attachments: Optional[List[Dict[str, Any]]] = None,
+                        max_tokens: Optional[int] = None) -> bytes:
+        # Returns the serialized request body. A trailing assistant message is continued by the backend.
         pass
     
     @abstractmethod
@@ -15,6 +19,10 @@ class LLMServiceAdapter(ABC):
     def parse_response(self, response_data: Dict[str, Any]) -> Dict[str, Any]:
         pass
 
+    @abstractmethod
+    def parse_usage(self, response_data: Dict[str, Any]) -> Dict[str, float]:
+        pass
+
     @abstractmethod
     def get_system_prompt(self) -> Dict[str, Any]:
         pass
@@ -49,7 +57,7 @@ class LLMServiceFactory:
         }
         
         if llm_service_provider not in adapters:
-            logger.warning(f"Unknown LLM service type: {llm_service_provider}.")
+            logger.warning("Unknown LLM service type: %s.", llm_service_provider)
             return None
         
         return adapters[llm_service_provider]
@@ -1,5 +1,6 @@
 from typing import Dict, Any, List, Optional
 from clients.llm.base import LLMServiceAdapter
+from memory.memory_manager import MemoryMessage
 from utils.logging_setup import logger
 
 
@@ -8,14 +9,11 @@ class LlamacppServerAdapter(LLMServiceAdapter):
         self.endpoint = f"{url}/v1/chat/completions"
         self.system_prompt = llm_model_options.get("system_prompt", "")
     
-    def prepare_payload(self, memory: List[Dict[str, Any]], attachments: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    def prepare_payload(self, memory: List[MemoryMessage], attachments: Optional[List[Dict[str, Any]]] = None,
+                        max_tokens: Optional[int] = None) -> bytes:
         # No multimodal.
-        messages = []
-        for message in memory:
-            for k, v in message.items():
-                messages.append({"role": k, "content": v})
-        
-        return {"messages": messages}
+        limit = b'"max_tokens": %d, ' % max_tokens if max_tokens else b""
+        return b'{' + limit + b'"messages": [' + b", ".join(message.fragment() for message in memory) + b"]}"
     
     def handle_attachments(self, attachments:Dict[str, Any]) -> List[Dict[str, Any]]:
         # No multimodal support for now.
@@ -52,6 +50,20 @@ class LlamacppServerAdapter(LLMServiceAdapter):
             "finish_reason": finish_reason
         }
 
+    def parse_usage(self, response_data: Dict[str, Any]) -> Dict[str, float]:
+        usage = response_data.get("usage") or {}
+        timings = response_data.get("timings") or {}
+        result = {}
+        if "prompt_tokens" in usage:
+            result["prompt_tokens"] = usage["prompt_tokens"]
+        if "completion_tokens" in usage:
+            result["completion_tokens"] = usage["completion_tokens"]
+        if "prompt_ms" in timings:
+            result["prefill_seconds"] = timings["prompt_ms"] / 1000
+        if "predicted_ms" in timings:
+            result["decode_seconds"] = timings["predicted_ms"] / 1000
+        return result
+
     def get_system_prompt(self) -> Dict[str, Any]:
         return {"system": self.system_prompt} if self.system_prompt else None
 
@@ -1,5 +1,7 @@
+import json
 from typing import Dict, Any, List, Optional
 from clients.llm.base import LLMServiceAdapter
+from memory.memory_manager import MemoryMessage
 from utils.logging_setup import logger
 
 
@@ -9,32 +11,32 @@ class OllamaAdapter(LLMServiceAdapter):
         self.model = llm_model_options.get("model", "")
         self.keep_alive = llm_model_options.get("keep_alive", 5)  # Ollama default is currently 5 min
         self.system_prompt = llm_model_options.get("system_prompt", "")
-    
-    def prepare_payload(self, memory: List[Dict[str, Any]], attachments: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-        messages = []
-        for message in memory:
-            for k, v in message.items():
-                if k == "user" and attachments and message is memory[-1]:  # Current message
-                    message_obj = {"role": k, "content": [{"type": "text", "text": v}]}
-                    # Atm only support images.
-                    for attachment in attachments:
-                        message_obj["content"].append({
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{attachment.get('content_type', 'image/jpeg')};base64,{attachment.get('data', '')}"
-                            }
-                        })
-                    
-                    messages.append(message_obj)
-                else:
-                    messages.append({"role": k, "content": v})
-        
-        return {
+        # Everything but the messages is the same for every request
+        self._payload_prefix = json.dumps({
             "model": self.model,
-            "messages": messages,
             "stream": False,
             "keep_alive": self.keep_alive
-        }
+        }).encode("utf-8")[:-1] + b', "messages": ['
+    
+    def prepare_payload(self, memory: List[MemoryMessage], attachments: Optional[List[Dict[str, Any]]] = None,
+                        max_tokens: Optional[int] = None) -> bytes:
+        fragments = [message.fragment() for message in memory]
+        current = memory[-1] if memory else None
+        if current and current.role == "user" and attachments:
+            # Images are only sent with the current message and are not remembered.
+            message_obj = {"role": current.role, "content": [{"type": "text", "text": current.content}]}
+            # Atm only support images.
+            for attachment in attachments:
+                message_obj["content"].append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{attachment.get('content_type', 'image/jpeg')};base64,{attachment.get('data', '')}"
+                    }
+                })
+            fragments[-1] = json.dumps(message_obj).encode("utf-8")
+        
+        limit = b', "max_tokens": %d' % max_tokens if max_tokens else b""
+        return self._payload_prefix + b", ".join(fragments) + b"]" + limit + b"}"
     
     def handle_attachments(self, attachments:Dict[str, Any]) -> List[Dict[str, Any]]:
         # only images and not gifs for now.
@@ -68,6 +70,21 @@ class OllamaAdapter(LLMServiceAdapter):
             "finish_reason": finish_reason
         }
 
+    def parse_usage(self, response_data: Dict[str, Any]) -> Dict[str, float]:
+        # The OpenAI-compatible endpoint only reports token counts. Durations (ns) are
+        # only present on the native api but are picked up if a proxy passes them through.
+        usage = response_data.get("usage") or {}
+        result = {}
+        if "prompt_tokens" in usage:
+            result["prompt_tokens"] = usage["prompt_tokens"]
+        if "completion_tokens" in usage:
+            result["completion_tokens"] = usage["completion_tokens"]
+        if "prompt_eval_duration" in response_data:
+            result["prefill_seconds"] = response_data["prompt_eval_duration"] / 1e9
+        if "eval_duration" in response_data:
+            result["decode_seconds"] = response_data["eval_duration"] / 1e9
+        return result
+
     def format_user_message(self, text: str) -> Dict[str, Any]:
         return {"user": "" if not text else text.rstrip()}
     
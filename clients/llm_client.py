@@ -1,26 +1,51 @@
-import traceback
-from typing import Dict, Any, Optional, List
+import time
+from typing import Dict, Any, Optional, List, Tuple
 
 from clients.http_client import HTTPClient
-from clients.llm.base import LLMServiceFactory
-from memory.memory_manager import MemoryManager
+from clients.circuit_breaker import CircuitBreaker
+from clients.fair_slots import FairSlots
+from clients.llm.base import LLMServiceAdapter, LLMServiceFactory
+from memory.memory_manager import MemoryManager, MemoryMessage
 from utils.logging_setup import logger
+from utils.metrics import metrics
+
+
+DEFAULT_UNAVAILABLE_REPLY = "The language model is unavailable at the moment. Please try again later."
+
+continuations_total = metrics.counter(
+    "signalllm_llm_continuations_total", "Continuation chunks requested after a reply hit the chunk limit."
+)
 
 
 class LLMClient:
     def __init__(self, llm_service_url: str, llm_api_key: str, llm_model_options: Dict[str, Any],
-                 memory_manager: MemoryManager, typing_client, llm_service_provider: str):
+                 memory_manager: MemoryManager, typing_client, llm_service_provider: str,
+                 recorder=None, circuit_breaker: Optional[CircuitBreaker] = None,
+                 unavailable_reply: str = DEFAULT_UNAVAILABLE_REPLY,
+                 service_adapter: Optional[LLMServiceAdapter] = None,
+                 request_slots: Optional[FairSlots] = None,
+                 chunk_tokens: Optional[int] = None, max_continuations: int = 8):
         self.llm_service_url = llm_service_url
         self.llm_api_key = llm_api_key
         self.llm_model_options = llm_model_options
         self.memory_manager = memory_manager
         self.typing_client = typing_client
-        self.service_adapter = LLMServiceFactory.get_adapter(
+        self.recorder = recorder
+        self.circuit_breaker = circuit_breaker or CircuitBreaker("llm")
+        self.unavailable_reply = unavailable_reply
+        # Limits concurrent requests to the backend. May be shared with other clients.
+        self.request_slots = request_slots
+        # Generate at most chunk_tokens per request and continue in later requests (see continue_message)
+        self.chunk_tokens = chunk_tokens
+        self.max_continuations = max_continuations
+        # recipient -> (prompt ending in the partial answer, continuations so far, adapter)
+        self._pending: Dict[str, Tuple[List[MemoryMessage], int, LLMServiceAdapter]] = {}
+        self.service_adapter = service_adapter or LLMServiceFactory.get_adapter(
             llm_service_provider, llm_service_url, llm_model_options
         )
         
         if self.service_adapter:
-            logger.info(f"Configured service provider: {llm_service_provider}.")
+            logger.info("Configured service provider: %s.", llm_service_provider)
         
         # If no memory: set system prompt.
         if not self.memory_manager.get_current_memory() and self.service_adapter.system_prompt:
@@ -29,51 +54,153 @@ class LLMClient:
                 self.memory_manager.set_memory([system_prompt])
     
     async def process_message(self, message: Dict[str, Any], recipient: str) -> Optional[Dict[str, Any]]:
+        # Settings can be swapped by a config reload. This message finishes on the adapter it started with.
+        adapter = self.service_adapter
         try:
+            # Fail fast while the backend is down instead of piling up requests.
+            if not self.circuit_breaker.allow_request():
+                return {"content": self.unavailable_reply, "attachments": []}
+
             text = message.get("text", "")
             attachments = message.get("attachments", [])
             
-            llm_attachments = self.service_adapter.handle_attachments(attachments)
-
-            # Only remember text (for context size)
-            if self.memory_manager.has_memory:
-                self.memory_manager.add_user_message(self.service_adapter.format_user_message(text))
-            else:
-                if self.service_adapter.system_prompt:
-                    system_prompt = self.service_adapter.get_system_prompt()
-                    user_message = self.service_adapter.format_user_message(text)
-                    self.memory_manager.set_memory([system_prompt, user_message])
-                else:
-                    self.memory_manager.set_memory([self.service_adapter.format_user_message(text)])
+            llm_attachments = adapter.handle_attachments(attachments)
 
-            memory = self.memory_manager.get_current_memory()
+            with metrics.span("memory_load"):
+                # Only remember text (for context size)
+                if self.memory_manager.has_memory:
+                    self.memory_manager.add_user_message(adapter.format_user_message(text))
+                else:
+                    if adapter.system_prompt:
+                        system_prompt = adapter.get_system_prompt()
+                        user_message = adapter.format_user_message(text)
+                        self.memory_manager.set_memory([system_prompt, user_message])
+                    else:
+                        self.memory_manager.set_memory([adapter.format_user_message(text)])
 
-            payload = self.service_adapter.prepare_payload(
-                memory, 
-                llm_attachments if llm_attachments else None
-            )
-            headers = self.service_adapter.prepare_headers(self.llm_api_key)
-            uri = self.service_adapter.endpoint
+                memory = self.memory_manager.get_current_memory()
 
-            raw_response = await self._make_api_request(uri, payload, headers)
+            raw_response = await self._request(adapter, memory, llm_attachments, recipient)
             if not raw_response:
                 return {"content": "Failed to get response from LLM service", "attachments": []}
-
-            response = self.service_adapter.parse_response(raw_response)
+            response = adapter.parse_response(raw_response)
 
             if response and self.memory_manager.has_memory:
                 self.memory_manager.add_model_response(
-                    self.service_adapter.format_model_response(response.get("content", ""))
+                    adapter.format_model_response(response.get("content", ""))
                 )
                 if self.memory_manager.save_memory:
-                    await self.memory_manager.save_conversation()
+                    with metrics.span("memory_save"):
+                        await self.memory_manager.save_conversation()
+
+            self._pending.pop(recipient, None)
+            if response and self.chunk_tokens and self.max_continuations > 0 and adapter.is_output_limited(response):
+                if self.memory_manager.has_memory:
+                    # memory is the live list and already ends with the answer
+                    prompt = list(memory)
+                else:
+                    prompt = memory + MemoryMessage.from_dicts(
+                        [adapter.format_model_response(response.get("content", ""))]
+                    )
+                self._pending[recipient] = (prompt, 0, adapter)
+                response["continues"] = True
                     
             return response
             
         except Exception as e:
-            logger.error(f"Error processing message with LLM: {e}")
-            logger.debug(traceback.format_exc())
+            logger.error("Error processing message with LLM: %s", e)
+            logger.debug("Traceback:", exc_info=True)
             return {"content": f"Sorry, I encountered an error: {str(e)}", "attachments": []}
     
-    async def _make_api_request(self, uri: str, payload: dict, headers: dict) -> Optional[dict]:
-        return await HTTPClient.post(uri, json_data=payload, headers=headers)
+    async def continue_message(self, recipient: str) -> Optional[Dict[str, Any]]:
+        # Generates the next chunk of a reply that hit chunk_tokens. The backend continues the trailing
+        # assistant message, which is then extended in memory as well.
+        pending = self._pending.pop(recipient, None)
+        if not pending or not self.circuit_breaker.allow_request():
+            return None
+        prompt, count, adapter = pending
+        partial = prompt[-1]
+        continuations_total.inc()
+        try:
+            raw_response = await self._request(adapter, prompt, None, recipient)
+            if not raw_response:
+                return None
+            response = adapter.parse_response(raw_response)
+
+            extended = MemoryMessage.from_dicts(
+                [adapter.format_model_response(partial.content + response.get("content", ""))]
+            )[0]
+            if self.memory_manager.has_memory and self.memory_manager.replace_message(partial, extended):
+                if self.memory_manager.save_memory:
+                    with metrics.span("memory_save"):
+                        await self.memory_manager.save_conversation()
+
+            if adapter.is_output_limited(response) and count + 1 < self.max_continuations:
+                self._pending[recipient] = (prompt[:-1] + [extended], count + 1, adapter)
+                response["continues"] = True
+            return response
+        except Exception as e:
+            logger.error("Error continuing message with LLM: %s", e)
+            logger.debug("Traceback:", exc_info=True)
+            return None
+
+    def discard_continuation(self, recipient: str) -> None:
+        self._pending.pop(recipient, None)
+
+    async def _request(self, adapter: LLMServiceAdapter, memory: List[MemoryMessage],
+                       llm_attachments: Optional[List[Dict[str, Any]]], recipient: str) -> Optional[Dict[str, Any]]:
+        with metrics.span("payload_build"):
+            payload = adapter.prepare_payload(
+                memory,
+                llm_attachments if llm_attachments else None,
+                max_tokens=self.chunk_tokens
+            )
+            headers = adapter.prepare_headers(self.llm_api_key)
+        uri = adapter.endpoint
+
+        if self.recorder:
+            await self.recorder.record_llm_request(recipient, payload)
+
+        request_slots = self.request_slots
+        if request_slots:
+            with metrics.span("llm_slot_wait"):
+                await request_slots.acquire(recipient)
+        try:
+            start = time.perf_counter()
+            raw_response, status = await self._make_api_request(uri, payload, headers)
+            request_seconds = time.perf_counter() - start
+        finally:
+            if request_slots:
+                request_slots.release()
+        metrics.record_stage("llm_request", request_seconds)
+        # Only an unreachable or failing backend counts against the breaker. A rejected request
+        # (4xx, e.g. context too long) says nothing about the backend's health.
+        if not raw_response and (status is None or status >= 500):
+            self.circuit_breaker.record_failure()
+            return None
+        self.circuit_breaker.record_success()
+        if not raw_response:
+            return None
+
+        self._record_usage(adapter, raw_response, request_seconds)
+        return raw_response
+    
+    def _record_usage(self, adapter: LLMServiceAdapter, raw_response: Dict[str, Any], request_seconds: float) -> None:
+        usage = adapter.parse_usage(raw_response)
+        if "prompt_tokens" in usage:
+            metrics.llm_tokens_total.inc(usage["prompt_tokens"], kind="prompt")
+        if "completion_tokens" in usage:
+            metrics.llm_tokens_total.inc(usage["completion_tokens"], kind="completion")
+        
+        prefill = usage.get("prefill_seconds")
+        decode = usage.get("decode_seconds")
+        if prefill is not None:
+            metrics.record_stage("llm_prefill", prefill)
+        if decode is not None:
+            metrics.record_stage("llm_decode", decode)
+        if prefill is not None and decode is not None:
+            # Whatever the backend did not spend computing was spent waiting for a slot (or on the wire).
+            metrics.record_stage("llm_queue_wait", max(0.0, request_seconds - prefill - decode))
+    
+    async def _make_api_request(self, uri: str, payload: bytes, headers: dict) -> Tuple[Optional[dict], Optional[int]]:
+        return await HTTPClient.post_with_status(uri, data=payload, headers=headers, call_type="llm")
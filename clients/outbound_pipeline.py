@@ -0,0 +1,117 @@
+import asyncio
+from typing import Dict, Any, List, Optional
+
+from clients.attachment_manager import AttachmentManager
+from clients.http_client import HTTPClient
+from utils.logging_setup import logger
+from utils.metrics import metrics
+
+
+outbound_messages_total = metrics.counter(
+    "signalllm_outbound_messages_total", "Messages sent through /v2/send, by result.", ("result",)
+)
+split_replies_total = metrics.counter(
+    "signalllm_split_replies_total", "Replies split into several messages because of their length."
+)
+
+
+def split_message(text: str, limit: int) -> List[str]:
+    # Splits at paragraph boundaries, falling back to line, sentence and word boundaries for
+    # paragraphs that are longer than the limit on their own.
+    if limit <= 0 or len(text) <= limit:
+        return [text]
+
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        candidate = f"{current}\n\n{paragraph}" if current else paragraph
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        pieces = _split_paragraph(paragraph, limit)
+        chunks.extend(pieces[:-1])
+        current = pieces[-1]
+    if current:
+        chunks.append(current)
+    # Always at least one message, attachments go with the first
+    return [chunk for chunk in chunks if chunk.strip()] or [""]
+
+
+def _split_paragraph(paragraph: str, limit: int) -> List[str]:
+    pieces = []
+    while len(paragraph) > limit:
+        window = paragraph[:limit]
+        for separator in ("\n", ". ", " "):
+            cut = window.rfind(separator)
+            if cut > 0:
+                cut += len(separator)
+                break
+        else:
+            cut = limit
+        pieces.append(paragraph[:cut].rstrip())
+        paragraph = paragraph[cut:].lstrip()
+    pieces.append(paragraph)
+    return pieces
+
+
+class OutboundPipeline:
+    # Delivers replies through /v2/send. Long replies go out as several messages in order, messages to the
+    # same recipient are never interleaved, and at most max_in_flight sends run at once. The window can be
+    # shared between accounts by passing the same semaphore.
+    def __init__(self, signal_service: str, phone_number: str, attachment_manager: AttachmentManager,
+                 max_message_length: int = 2000, max_in_flight: int = 4, inline_attachments: bool = True,
+                 send_slots: Optional[asyncio.Semaphore] = None):
+        self.uri = f"http://{signal_service}/v2/send"
+        self.phone_number = phone_number
+        self.attachment_manager = attachment_manager
+        self.max_message_length = max_message_length
+        self.inline_attachments = inline_attachments
+        self.send_slots = send_slots or asyncio.Semaphore(max_in_flight)
+        self._recipient_locks: Dict[str, asyncio.Lock] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def build_payloads(self, recipient: str, response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        chunks = split_message(response.get("content", ""), self.max_message_length)
+        if len(chunks) > 1:
+            split_replies_total.inc()
+        payloads = [
+            {"message": chunk, "number": self.phone_number, "recipients": [recipient]}
+            for chunk in chunks
+        ]
+
+        # Attachments go with the first message
+        attachments = response.get("attachments", [])
+        if attachments:
+            if self.inline_attachments:
+                payloads[0]["base64_attachments"] = [
+                    self.attachment_manager.as_data_uri(attachment) for attachment in attachments
+                ]
+            else:
+                attachment_ids = await self.attachment_manager.upload_attachments(attachments)
+                if attachment_ids:
+                    payloads[0]["attachments"] = attachment_ids
+        return payloads
+
+    async def send(self, recipient: str, response: Dict[str, Any]) -> None:
+        payloads = await self.build_payloads(recipient, response)
+
+        lock = self._recipient_locks.setdefault(recipient, asyncio.Lock())
+        self._waiters[recipient] = self._waiters.get(recipient, 0) + 1
+        try:
+            async with lock:
+                for index, payload in enumerate(payloads):
+                    async with self.send_slots:
+                        result = await HTTPClient.post(self.uri, json_data=payload)
+                    outbound_messages_total.inc(result="sent" if result is not None else "failed")
+                    if result is None:
+                        # Later parts make no sense without this one
+                        logger.error("Failed to send reply to %s, dropping %s remaining part(s)",
+                                     recipient, len(payloads) - index - 1)
+                        break
+        finally:
+            self._waiters[recipient] -= 1
+            if not self._waiters[recipient]:
+                del self._waiters[recipient]
+                del self._recipient_locks[recipient]
@@ -1,52 +1,133 @@
+import asyncio
 import json
 import time
-import traceback
+from collections import OrderedDict
 from typing import Dict, Any, Optional, List
 
 from clients.http_client import HTTPClient
 from clients.websocket_client import WebsocketClient
 from clients.attachment_manager import AttachmentManager
+from clients.capture_recorder import CaptureRecorder
+from clients.outbound_pipeline import OutboundPipeline
+from clients.group_gate import GroupGate
 from clients.typing_client import TypingClient
 from commands.command_manager import CommandManager
 from memory.memory_manager import MemoryManager
-from utils.logging_setup import logger
+from utils.logging_setup import logger, set_log_context, bind_log_context
+from utils.metrics import metrics
+from utils.profiler import SlowMessageProfiler
+
+
+duplicates_total = metrics.counter(
+    "signalllm_duplicate_envelopes_total", "Envelopes skipped because they were already handled."
+)
+catch_up_total = metrics.counter(
+    "signalllm_catch_up_envelopes_total", "Envelopes fetched through the REST receive endpoint after a reconnect."
+)
 
 
 class SignalClient:
     def __init__(self, signal_service: str, phone_number: str, save_attachments: bool, llm_client, 
                  memory_manager: MemoryManager, typing_client: TypingClient,
-                 command_manager: Optional[CommandManager] = None):
+                 command_manager: Optional[CommandManager] = None,
+                 recorder: Optional[CaptureRecorder] = None,
+                 profiler: Optional[SlowMessageProfiler] = None,
+                 ping_interval: Optional[float] = 20, ping_timeout: Optional[float] = 20,
+                 catch_up: bool = False, outbound_options: Optional[Dict[str, Any]] = None,
+                 group_gate: Optional[GroupGate] = None):
         self.signal_service = signal_service
         self.phone_number = phone_number
         self.llm_client = llm_client
         self.memory_manager = memory_manager
         self.typing_client = typing_client
         self.command_manager = command_manager or CommandManager()
+        self.recorder = recorder
+        self.profiler = profiler
         self.attachment_manager = AttachmentManager(signal_service, save_attachments)
+        self.outbound = OutboundPipeline(
+            signal_service, phone_number, self.attachment_manager, **(outbound_options or {})
+        )
+        self.group_gate = group_gate
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        # (sender, timestamp) of recently handled envelopes, oldest first
+        self._seen_envelopes: "OrderedDict[tuple, None]" = OrderedDict()
+        self._seen_limit = 1000
+        # recipient -> task delivering the rest of a reply generated in chunks
+        self._continuations: Dict[str, asyncio.Task] = {}
         
         # Create WebSocket client
         ws_uri = f"ws://{self.signal_service}/v1/receive/{self.phone_number}"
-        self.websocket_client = WebsocketClient(ws_uri, self._handle_message)
+        self.websocket_client = WebsocketClient(
+            ws_uri, self._handle_message,
+            on_reconnect=self.catch_up if catch_up else None,
+            name=self.phone_number
+        )
     
     async def start(self) -> None:
         logger.info("Starting Signal API Relay service...")
-        await self.websocket_client.connect(ping_interval=None)
+        await self.websocket_client.connect(ping_interval=self.ping_interval, ping_timeout=self.ping_timeout)
+    
+    @staticmethod
+    async def fetch_pending(signal_service: str, phone_number: str) -> List[str]:
+        # Drains messages signal-cli received while the websocket was down.
+        # Only available when signal-cli-rest-api is not in json-rpc mode; returns nothing otherwise.
+        uri = f"http://{signal_service}/v1/receive/{phone_number}?timeout=1"
+        content = await HTTPClient.get(uri)
+        if not content:
+            return []
+        try:
+            envelopes = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error("Invalid JSON from receive endpoint: %s", e)
+            return []
+        catch_up_total.inc(len(envelopes))
+        return [json.dumps(envelope) for envelope in envelopes]
+    
+    async def catch_up(self) -> List[str]:
+        pending = await self.fetch_pending(self.signal_service, self.phone_number)
+        if pending:
+            logger.info("Catching up on %s envelope(s) received while disconnected", len(pending))
+        return pending
+    
+    def _is_duplicate(self, envelope: Dict[str, Any]) -> bool:
+        key = (envelope.get("sourceUuid") or envelope.get("source"), envelope.get("timestamp"))
+        if key in self._seen_envelopes:
+            duplicates_total.inc()
+            return True
+        self._seen_envelopes[key] = None
+        if len(self._seen_envelopes) > self._seen_limit:
+            self._seen_envelopes.popitem(last=False)
+        return False
     
     async def _handle_message(self, raw_message: str) -> None:
+        timings = metrics.begin_message()
+        set_log_context(timings=timings)
+        profile = self.profiler.begin() if self.profiler else None
+        start = time.perf_counter()
+        outcome = "error"
         try:
+            if self.recorder:
+                await self.recorder.record_inbound(raw_message)
+            
             message = await self._parse_message(raw_message)
             if not message:
+                outcome = "ignored"
                 return
+            bind_log_context(conversation=message.get("recipient"))
             
             if not message.get("text") and not message.get("attachments"):
+                outcome = "ignored"
                 return
             
+            recipient = message.get("recipient")
+            # A new message (commands included) supersedes the rest of the previous answer
+            await self._cancel_continuation(recipient)
+
             text = message.get("text", "")
             if self.command_manager and await self.command_manager.handle_command(text):
+                outcome = "command"
                 return
-            
-            recipient = message.get("recipient")
-
 
             # Start typing
             await self.typing_client.start_typing(recipient)
@@ -60,18 +141,75 @@ class SignalClient:
                 
                 # Send response back
                 if response:
-                    await self._send_signal_response(recipient, response)
+                    with metrics.span("send"):
+                        await self._send_signal_response(recipient, response)
+                    if response.get("continues"):
+                        self._continuations[recipient] = asyncio.create_task(self._continue_reply(recipient))
+                outcome = "replied"
             except Exception as e:
                 await self.typing_client.close()
-                logger.error(f"Error processing message with LLM: {e}")
-                logger.debug(traceback.format_exc())
+                logger.error("Error processing message with LLM: %s", e)
+                logger.debug("Traceback:", exc_info=True)
                 
         except Exception as e:
-            logger.error(f"Error in message handling: {e}")
-            logger.debug(traceback.format_exc())
+            logger.error("Error in message handling: %s", e)
+            logger.debug("Traceback:", exc_info=True)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.messages_total.inc(outcome=outcome)
+            if outcome == "replied":
+                metrics.message_seconds.observe(elapsed)
+            logger.debug("Message %s in %.3f s", outcome, elapsed)
+            if profile:
+                await self.profiler.end(profile, elapsed, timings, outcome)
+            set_log_context()
+    
+    async def _cancel_continuation(self, recipient: str) -> None:
+        self.llm_client.discard_continuation(recipient)
+        task = self._continuations.pop(recipient, None)
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _continue_reply(self, recipient: str) -> None:
+        # Each chunk queues for a backend slot again, behind the other conversations.
+        set_log_context(conversation=recipient, timings=metrics.begin_message())
+        try:
+            while True:
+                await self.typing_client.start_typing(recipient)
+                try:
+                    response = await self.llm_client.continue_message(recipient)
+                finally:
+                    await self.typing_client.stop_typing(recipient)
+                if not response:
+                    return
+                # A chunk usually starts with the whitespace that separated it from the previous one
+                response["content"] = response.get("content", "").lstrip()
+                if response["content"] or response.get("attachments"):
+                    await self._send_signal_response(recipient, response)
+                if not response.get("continues"):
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error continuing reply: %s", e)
+            logger.debug("Traceback:", exc_info=True)
+        finally:
+            if self._continuations.get(recipient) is asyncio.current_task():
+                del self._continuations[recipient]
+
+    @staticmethod
+    def get_recipient(envelope: Dict[str, Any]) -> Optional[str]:
+        if "dataMessage" in envelope and "groupInfo" in envelope["dataMessage"]:
+            return envelope["dataMessage"]["groupInfo"]["groupId"]
+        return envelope.get("source")
     
     async def _parse_message(self, raw_message: str) -> Optional[Dict[str, Any]]:
         try:
+            parse_start = time.perf_counter()
             data = json.loads(raw_message)
             envelope = data.get("envelope", {})
             
@@ -83,10 +221,7 @@ class SignalClient:
             }
             
             # Get recipient for reply
-            if "dataMessage" in envelope and "groupInfo" in envelope["dataMessage"]:
-                result["recipient"] = envelope["dataMessage"]["groupInfo"]["groupId"]
-            else:
-                result["recipient"] = envelope.get("source")
+            result["recipient"] = self.get_recipient(envelope)
             
             message_data = None
             if "dataMessage" in envelope:
@@ -97,51 +232,52 @@ class SignalClient:
                 result["type"] = "sync_message"
             else:
                 return None
+            
+            if self._is_duplicate(envelope):
+                return None
                 
             if "message" in message_data:
                 result["text"] = message_data["message"]
+
+            # Skip group chatter before anything expensive happens
+            if self.group_gate and "groupInfo" in message_data:
+                group_id = message_data["groupInfo"]["groupId"]
+                text = self.group_gate.addressed_text(group_id, message_data, result.get("text") or "")
+                if text is None:
+                    self.group_gate.remember(
+                        group_id, envelope.get("sourceName") or envelope.get("source") or "", result.get("text")
+                    )
+                    metrics.record_stage("parse", time.perf_counter() - parse_start)
+                    return None
+                context = self.group_gate.take_context(group_id)
+                result["text"] = f"{context}\n\n{text}" if context else text
+            metrics.record_stage("parse", time.perf_counter() - parse_start)
             
             if "attachments" in message_data and message_data["attachments"]:
-                for attachment in message_data["attachments"]:
-                    attachment_id, attachment_data = await self.attachment_manager.handle_attachment(attachment)
-                    if attachment_data:
-                        result["attachments"].append({
-                            "id": attachment_id,
-                            "content_type": attachment.get("contentType", ""),
-                            "filename": attachment.get("filename", ""),
-                            "data": attachment_data
-                        })
+                with metrics.span("attachment_fetch"):
+                    for attachment in message_data["attachments"]:
+                        attachment_id, attachment_data = await self.attachment_manager.handle_attachment(attachment)
+                        if attachment_data:
+                            if self.recorder:
+                                await self.recorder.record_attachment(
+                                    attachment_id, attachment_data, attachment.get("contentType", "")
+                                )
+                            result["attachments"].append({
+                                "id": attachment_id,
+                                "content_type": attachment.get("contentType", ""),
+                                "filename": attachment.get("filename", ""),
+                                "data": attachment_data
+                            })
             
             return result
             
         except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in message: {e}")
+            logger.error("Invalid JSON in message: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Failed to parse message: {e}")
-            logger.debug(traceback.format_exc())
+            logger.error("Failed to parse message: %s", e)
+            logger.debug("Traceback:", exc_info=True)
             return None
     
     async def _send_signal_response(self, recipient: str, response: Dict[str, Any]) -> None:
-        uri = f"http://{self.signal_service}/v2/send"
-        
-        text = response.get("content", "")
-        attachments = response.get("attachments", [])
-
-        payload = {
-            "message": text,
-            "number": self.phone_number,
-            "recipients": [recipient]
-        }
-
-        if attachments:
-            attachment_ids = []
-            for attachment in attachments:
-                attachment_id = await self.attachment_manager.upload_attachment(attachment)
-                if attachment_id:
-                    attachment_ids.append(attachment_id)
-            
-            if attachment_ids:
-                payload["attachments"] = attachment_ids
-
-        await HTTPClient.post(uri, json_data=payload)
+        await self.outbound.send(recipient, response)
@@ -44,13 +44,13 @@ class TypingClient:
         payload = {"recipient": recipient}
         result = await HTTPClient.put(self._uri, payload)
         if not result:
-            logger.error(f"Failed to send typing indicator to {recipient}")
+            logger.error("Failed to send typing indicator to %s", recipient)
     
     async def _send_stop_typing(self, recipient: str) -> None:
         payload = {"recipient": recipient}
         result = await HTTPClient.delete(self._uri, payload)
         if not result:
-            logger.error(f"Failed to stop typing indicator for {recipient}")
+            logger.error("Failed to stop typing indicator for %s", recipient)
     
     # Force cancel
     def cancel_all_typing(self) -> None:
@@ -1,78 +1,151 @@
 import asyncio
-import traceback
+import random
+import time
 import websockets
-from typing import Callable, Awaitable, Optional
+from typing import Callable, Awaitable, List, Optional
 from utils.logging_setup import logger
+from utils.metrics import metrics
+
+
+connected_gauge = metrics.gauge(
+    "signalllm_websocket_connected", "1 while the receive websocket is connected.", ("name",)
+)
+reconnects_total = metrics.counter(
+    "signalllm_websocket_reconnects_total", "Websocket reconnects after a lost connection.", ("name",)
+)
+downtime_seconds_total = metrics.counter(
+    "signalllm_websocket_downtime_seconds_total", "Time spent without a receive websocket.", ("name",)
+)
+backlog_gauge = metrics.gauge(
+    "signalllm_websocket_backlog", "Received messages waiting to be handled.", ("name",)
+)
 
 
 class WebsocketClient:
-    def __init__(self, url: str, message_handler: Callable[[str], Awaitable[None]]):
+    # Frames are read as soon as they arrive and queued for message_handler, which runs in a separate task.
+    # A slow handler therefore never stops the socket from being read, so heartbeats keep being answered
+    # and the server does not drop the connection (and the frames it already pushed).
+    def __init__(self, url: str, message_handler: Callable[[str], Awaitable[None]],
+                 on_reconnect: Optional[Callable[[], Awaitable[List[str]]]] = None, name: Optional[str] = None):
         self.url = url
         self.message_handler = message_handler
+        # Called after a lost connection is re-established. Returns the messages missed in between,
+        # which are queued like received ones.
+        self.on_reconnect = on_reconnect
+        self.name = name or url
         self.websocket = None
         self.connected = False
-    
-    async def connect(self, max_retries=5, ping_interval=None) -> None:
+        self._disconnected_at: Optional[float] = None
+        self._inbox: "asyncio.Queue[str]" = asyncio.Queue()
+
+    async def connect(self, max_retries=5, ping_interval=None, ping_timeout=None, max_backoff=30) -> None:
         retry_count = 0
-        
-        while True:
-            try:
-                self.websocket = await websockets.connect(self.url, ping_interval=ping_interval)
-                self.connected = True
-                logger.info(f"Connected to WebSocket at {self.url}")
-                await self._listen_for_messages()
-                retry_count = 0
-            except websockets.exceptions.ConnectionClosed as e:
-                logger.error(f"WebSocket connection closed: {e}")
-                self.connected = False
+        # Outlives the connections, messages queued before a disconnect are still handled.
+        consumer = asyncio.create_task(self._consume())
+
+        try:
+            while True:
+                reader = None
+                try:
+                    self.websocket = await websockets.connect(
+                        self.url, ping_interval=ping_interval, ping_timeout=ping_timeout
+                    )
+                    self.connected = True
+                    connected_gauge.set(1, name=self.name)
+                    logger.info("Connected to WebSocket at %s", self.url)
+                    retry_count = 0
+                    reader = asyncio.create_task(self._listen_for_messages())
+                    await self._after_connect()
+                    await reader
+                    logger.error("WebSocket connection closed by server")
+                except websockets.exceptions.ConnectionClosed as e:
+                    logger.error("WebSocket connection closed: %s", e)
+                except Exception as e:
+                    logger.error("WebSocket connection error: %s", e)
+                    logger.debug("Traceback:", exc_info=True)
+                finally:
+                    if reader and not reader.done():
+                        reader.cancel()
+                self._mark_disconnected()
                 retry_count += 1
+
+                # The first attempt after losing a connection is immediate, repeated failures back off.
+                if retry_count == 1:
+                    continue
+                if retry_count == max_retries:
+                    logger.error("Still not connected after %s attempts. Retrying with backoff of up to %s seconds.",
+                                 max_retries, max_backoff)
+                wait_time = random.uniform(0.5, 1) * min(max_backoff, 2 ** (retry_count - 1))
+                logger.info("Reconnecting in %.1f seconds... (Attempt %s)", wait_time, retry_count)
+                await asyncio.sleep(wait_time)
+        finally:
+            consumer.cancel()
+
+    def _mark_disconnected(self) -> None:
+        self.connected = False
+        connected_gauge.set(0, name=self.name)
+        if self._disconnected_at is None:
+            self._disconnected_at = time.monotonic()
+
+    async def _after_connect(self) -> None:
+        if self._disconnected_at is None:
+            return
+        downtime = time.monotonic() - self._disconnected_at
+        self._disconnected_at = None
+        reconnects_total.inc(name=self.name)
+        downtime_seconds_total.inc(downtime, name=self.name)
+        logger.info("Reconnected after %.1f seconds", downtime)
+        if self.on_reconnect:
+            # The reader is already running, so the connection stays healthy while this waits.
+            try:
+                for message in await self.on_reconnect():
+                    self._enqueue(message)
             except Exception as e:
-                logger.error(f"WebSocket connection error: {e}")
-                logger.debug(traceback.format_exc())
-                self.connected = False
-                retry_count += 1
-            
-            # Reconnection with exponential backoff
-            wait_time = min(30, 2 ** retry_count)
-            logger.info(f"Reconnecting in {wait_time} seconds... (Attempt {retry_count}/{max_retries})")
-            await asyncio.sleep(wait_time)
-            
-            if retry_count >= max_retries:
-                logger.error(f"Max retries ({max_retries}) exceeded. Waiting 60 seconds before trying again.")
-                retry_count = 0
-                await asyncio.sleep(60)
-    
+                logger.error("Error catching up after reconnect: %s", e)
+                logger.debug("Traceback:", exc_info=True)
+
     async def _listen_for_messages(self) -> None:
         if not self.websocket:
             logger.error("WebSocket not connected")
             return
-        
+
         async for message in self.websocket:
+            self._enqueue(message)
+
+    def _enqueue(self, message: str) -> None:
+        self._inbox.put_nowait(message)
+        backlog_gauge.set(self._inbox.qsize(), name=self.name)
+
+    async def _consume(self) -> None:
+        while True:
+            message = await self._inbox.get()
+            backlog_gauge.set(self._inbox.qsize(), name=self.name)
             try:
                 await self.message_handler(message)
             except Exception as e:
-                logger.error(f"Error handling WebSocket message: {e}")
-                logger.debug(traceback.format_exc())
-    
+                logger.error("Error handling WebSocket message: %s", e)
+                logger.debug("Traceback:", exc_info=True)
+
     async def send(self, message: str) -> bool:
         if not self.websocket or not self.connected:
             logger.error("Cannot send message: WebSocket not connected")
             return False
-        
+
         try:
             await self.websocket.send(message)
             return True
         except Exception as e:
-            logger.error(f"Error sending WebSocket message: {e}")
-            logger.debug(traceback.format_exc())
+            logger.error("Error sending WebSocket message: %s", e)
+            logger.debug("Traceback:", exc_info=True)
             return False
-    
+
     async def close(self) -> None:
         if self.websocket and self.connected:
             try:
                 await self.websocket.close()
                 self.connected = False
+                connected_gauge.set(0, name=self.name)
                 logger.info("WebSocket connection closed")
             except Exception as e:
-                logger.error(f"Error closing WebSocket connection: {e}")
-                logger.debug(traceback.format_exc())
+                logger.error("Error closing WebSocket connection: %s", e)
+                logger.debug("Traceback:", exc_info=True)
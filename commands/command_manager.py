@@ -8,7 +8,7 @@ class CommandManager:
     
     def register_command(self, command: str, handler: Callable[[], Awaitable[None]]) -> None:
         self.commands[command] = handler
-        logger.info(f"Registered command: {command}")
+        logger.info("Registered command: %s", command)
     
     async def handle_command(self, text: str) -> bool:
         try:
@@ -18,5 +18,5 @@ class CommandManager:
                     return True
             return False
         except Exception as e:
-            logger.error(f"Error handling command: {e}")
+            logger.error("Error handling command: %s", e)
             return False
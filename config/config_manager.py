@@ -1,21 +1,136 @@
 import json
+import logging
+import os
+from typing import Dict, Any, List, Optional, Union
 from utils.logging_setup import logger
 
 
+def namespaced_file(filename: str, namespace: Optional[Union[int, str]]) -> str:
+    # conversation_history.json -> conversation_history.<namespace>.json
+    if namespace is None:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{namespace}{ext}"
+
+
+REQUIRED_SETTINGS = (
+    "signal_service", "phone_number", "has_memory", "save_memory", "save_attachments", "memory_file",
+    "llm_service_provider", "llm_service_url", "llm_api_key", "llm_model_options"
+)
+LLM_SERVICE_PROVIDERS = ("ollama", "llamacpp")
+HTTP_TIMEOUT_KEYS = ("total", "connect", "read")
+CIRCUIT_BREAKER_KEYS = ("failure_threshold", "recovery_timeout")
+GROUP_TRIGGER_TYPES = {
+    "mention": bool, "quote": bool, "prefix": str, "sample_rate": (int, float),
+    "remember_unaddressed": bool, "context_lines": int
+}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+
 class ConfigManager:
-    def __init__(self, config_path="config.json"):
+    def __init__(self, config_path="config.json", error_level=logging.CRITICAL):
+        # A failed reload is not fatal, reloads pass error_level=logging.ERROR
+        self.config_path = config_path
+        self.error_level = error_level
         self.config = self._load_config(config_path)
+    
+    def validate(self) -> None:
+        # Raises ValueError describing everything wrong with the config
+        errors = []
+        for account_config in self.account_configs():
+            name = account_config.get("phone_number", "account")
+            missing = [key for key in REQUIRED_SETTINGS if key not in account_config]
+            if missing:
+                errors.append(f"{name}: missing {', '.join(missing)}")
+            if account_config.get("llm_service_provider") not in LLM_SERVICE_PROVIDERS:
+                errors.append(f"{name}: unknown llm_service_provider {account_config.get('llm_service_provider')!r}")
+            if not isinstance(account_config.get("llm_model_options", {}), dict):
+                errors.append(f"{name}: llm_model_options must be an object")
+            errors.extend(f"{name}: {error}" for error in self._group_trigger_errors(account_config.get("group_triggers")))
+        for key in ("llm_concurrency", "max_sends_in_flight", "llm_chunk_tokens", "max_message_length"):
+            if key in self.config and (not isinstance(self.config[key], int) or self.config[key] < 0):
+                errors.append(f"{key} must be a non-negative integer")
+        errors.extend(self._http_errors())
+        breaker = self.config.get("llm_circuit_breaker", {})
+        if not isinstance(breaker, dict) or any(
+            key not in CIRCUIT_BREAKER_KEYS or not _is_number(value) for key, value in breaker.items()
+        ):
+            errors.append(f"llm_circuit_breaker must map {', '.join(CIRCUIT_BREAKER_KEYS)} to non-negative numbers")
+        level = self.config.get("log_level", "INFO")
+        if not isinstance(level, int) and not isinstance(logging.getLevelName(level), int):
+            errors.append(f"unknown log_level {level!r}")
+        if errors:
+            raise ValueError("; ".join(errors))
         
+    def _http_errors(self) -> List[str]:
+        errors = []
+        timeouts = self.config.get("http_timeouts", {})
+        if not isinstance(timeouts, dict) or any(
+            not isinstance(values, dict) or any(
+                key not in HTTP_TIMEOUT_KEYS or (value is not None and not _is_number(value))
+                for key, value in values.items()
+            )
+            for values in timeouts.values()
+        ):
+            errors.append(f"http_timeouts must map call types to objects of {', '.join(HTTP_TIMEOUT_KEYS)} in seconds")
+        retries = self.config.get("http_retries", {})
+        if not isinstance(retries, dict) or any(
+            not isinstance(value, int) or isinstance(value, bool) or value < 0 for value in retries.values()
+        ):
+            errors.append("http_retries must map call types to non-negative integers")
+        return errors
+
+    @staticmethod
+    def _group_trigger_errors(triggers: Any) -> List[str]:
+        if not triggers:
+            return []
+        if not isinstance(triggers, dict):
+            return ["group_triggers must be an object"]
+        errors = []
+        for group_id, policy in triggers.items():
+            if not isinstance(policy, dict):
+                errors.append(f"group_triggers[{group_id!r}] must be an object")
+                continue
+            for key, value in policy.items():
+                expected = GROUP_TRIGGER_TYPES.get(key)
+                if expected is None:
+                    errors.append(f"group_triggers[{group_id!r}]: unknown setting {key!r}")
+                elif not isinstance(value, expected) or (expected is not bool and isinstance(value, bool)):
+                    errors.append(f"group_triggers[{group_id!r}]: {key} has the wrong type")
+                elif key == "sample_rate" and not 0 <= value <= 1:
+                    errors.append(f"group_triggers[{group_id!r}]: sample_rate must be between 0 and 1")
+        return errors
+
+    def account_configs(self) -> List[Dict[str, Any]]:
+        # "accounts" entries override any top level setting for that account.
+        # Without it the top level "phone_number" is the only account.
+        shared = {k: v for k, v in self.config.items() if k != "accounts"}
+        entries = self.config.get("accounts") or [{}]
+        configs = []
+        for entry in entries:
+            account_config = {**shared, **entry}
+            if len(entries) > 1:
+                # Keep memory and captures of different accounts apart unless set explicitly.
+                namespace = account_config["phone_number"].lstrip("+")
+                for key in ("memory_file", "capture_file"):
+                    if account_config.get(key) and key not in entry:
+                        account_config[key] = namespaced_file(account_config[key], namespace)
+            configs.append(account_config)
+        return configs
+
     def _load_config(self, config_path):
         try:
             with open(config_path, "r") as f:
                 return json.load(f)
         except FileNotFoundError as e:
-            logger.critical(f"Config file not found: {config_path}")
+            logger.log(self.error_level, "Config file not found: %s", config_path)
             raise
         except json.JSONDecodeError as e:
-            logger.critical(f"Invalid JSON in config file: {e}")
+            logger.log(self.error_level, "Invalid JSON in config file: %s", e)
             raise
         except Exception as e:
-            logger.critical(f"Unexpected error loading config: {e}")
+            logger.log(self.error_level, "Unexpected error loading config: %s", e)
             raise
@@ -10,91 +10,255 @@ Debian-like linux prerequisites:
 """
 import asyncio
 import json
+import logging
 import os
-import traceback
+import signal
+from typing import Dict, Any, Optional
 
 from config.config_manager import ConfigManager
-from memory.memory_manager import MemoryManager
-from clients.typing_client import TypingClient
-from clients.llm_client import LLMClient
-from clients.signal_client import SignalClient
-from commands.command_manager import CommandManager
-from utils.logging_setup import logger
+from accounts.account import Account
+from clients.http_client import HTTPClient
+from clients.circuit_breaker import CircuitBreaker
+from clients.fair_slots import FairSlots
+from clients.llm.base import LLMServiceAdapter, LLMServiceFactory
+from workers.worker_pool import WorkerPool, consume
+from utils.logging_setup import logger, setup_logging
+from utils.metrics import metrics, MetricsServer
+from utils.profiler import SlowMessageProfiler
+
+
+# Settings that are only read at startup
+RESTART_SETTINGS = (
+    "signal_service", "has_memory", "save_memory", "save_attachments", "memory_file", "capture_file",
+    "workers", "metrics_port", "metrics_host", "profile_threshold", "max_sends_in_flight",
+    "websocket_ping_interval", "websocket_ping_timeout", "catch_up_on_reconnect"
+)
 
 
 class Application:
-    def __init__(self, api_key:str, config_path="config.json"):
+    def __init__(self, api_key:str, config_path="config.json", partition: Optional[int] = None):
         self.config_manager = ConfigManager(config_path)
         config = self.config_manager.config
+        self.config_path = config_path
+        setup_logging(level=config.get("log_level", "INFO"), json_format=config.get("log_format") == "json")
+        # Set when running as one of several worker processes (see WorkerPool).
+        self.partition = partition
         
-        self.memory_manager = MemoryManager(
-            has_memory=config["has_memory"],
-            save_memory=config["save_memory"],
-            memory_file=config["memory_file"]
+        HTTPClient.configure(
+            timeouts=config.get("http_timeouts"),
+            retries=config.get("http_retries")
         )
 
-        self.typing_client = TypingClient(
-            signal_service=config["signal_service"],
-            phone_number=config["phone_number"],
-            refresh_interval=10
-        )
-        
-        self.llm_client = LLMClient(
-            llm_service_url=config["llm_service_url"],
-            llm_api_key=config["llm_api_key"] if not api_key else api_key,
-            llm_service_provider=config["llm_service_provider"],
-            llm_model_options=config["llm_model_options"],
-            memory_manager=self.memory_manager,
-            typing_client=self.typing_client
-        )
-        
-        # Set up command manager
-        self.command_manager = CommandManager()
-        
-        # Register command(s)
-        if config.get("reset_memory_word"):
-            self.command_manager.register_command(
-                config["reset_memory_word"],
-                self._reset_memory_command
+        # Optional profiling of slow messages
+        self.profiler = None
+        if config.get("profile_threshold"):
+            self.profiler = SlowMessageProfiler(threshold=config["profile_threshold"])
+
+        # Shared by all accounts. Circuit breakers are per backend, like the adapters.
+        self._circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self.request_slots = FairSlots(config["llm_concurrency"]) if config.get("llm_concurrency") else None
+        self.send_slots = asyncio.Semaphore(config.get("max_sends_in_flight", 4))
+        self._service_adapters: Dict[str, LLMServiceAdapter] = {}
+
+        self.accounts: Dict[str, Account] = {}
+        for account_config in self.config_manager.account_configs():
+            account = Account(
+                account_config,
+                api_key=api_key,
+                service_adapter=self._get_service_adapter(account_config),
+                circuit_breaker=self._get_circuit_breaker(account_config, config.get("llm_circuit_breaker", {})),
+                request_slots=self.request_slots,
+                send_slots=self.send_slots,
+                profiler=self.profiler,
+                partition=partition
+            )
+            self.accounts[account.phone_number] = account
+
+        # Optional Prometheus endpoint. Workers serve theirs on the following ports.
+        self.metrics_server = None
+        if config.get("metrics_port"):
+            self.metrics_server = MetricsServer(
+                metrics,
+                host=config.get("metrics_host", "127.0.0.1"),
+                port=config["metrics_port"] + (0 if partition is None else partition + 1)
             )
-        
-        self.signal_client = SignalClient(
-            signal_service=config["signal_service"],
-            phone_number=config["phone_number"],
-            save_attachments=config["save_attachments"],
-            memory_manager=self.memory_manager,
-            llm_client=self.llm_client,
-            typing_client=self.typing_client,
-            command_manager=self.command_manager
-        )
     
-    async def _reset_memory_command(self) -> None:
-        self.memory_manager.reset_memory()
-        if self.llm_client.service_adapter.system_prompt:
-            system_prompt = self.llm_client.service_adapter.get_system_prompt()
-            if system_prompt:
-                self.memory_manager.set_memory([system_prompt])
-        await self.memory_manager.save_conversation()
-        logger.info("Memory reset command executed")
+    @staticmethod
+    def _backend_key(account_config: Dict[str, Any]) -> str:
+        return json.dumps([
+            account_config["llm_service_provider"],
+            account_config["llm_service_url"],
+            account_config["llm_model_options"]
+        ], sort_keys=True)
+
+    def _get_circuit_breaker(self, account_config: Dict[str, Any], settings: Dict[str, Any],
+                             circuit_breakers: Optional[Dict[str, CircuitBreaker]] = None) -> CircuitBreaker:
+        # One breaker per backend, so a backend going down only fails its own accounts fast.
+        if circuit_breakers is None:
+            circuit_breakers = self._circuit_breakers
+        key = self._backend_key(account_config)
+        if key not in circuit_breakers:
+            # Unchanged backends keep their breaker (and its state) across config reloads
+            circuit_breakers[key] = self._circuit_breakers.get(key) or CircuitBreaker(
+                account_config["llm_service_url"], **settings
+            )
+        return circuit_breakers[key]
+
+    def _get_service_adapter(self, account_config: Dict[str, Any],
+                             service_adapters: Optional[Dict[str, LLMServiceAdapter]] = None) -> LLMServiceAdapter:
+        # Accounts with identical backend settings share one adapter.
+        if service_adapters is None:
+            service_adapters = self._service_adapters
+        key = self._backend_key(account_config)
+        if key not in service_adapters:
+            # Unchanged backends keep their adapter across config reloads
+            service_adapters[key] = self._service_adapters.get(key) or LLMServiceFactory.get_adapter(
+                account_config["llm_service_provider"],
+                account_config["llm_service_url"],
+                account_config["llm_model_options"]
+            )
+        return service_adapters[key]
+
+    def reload_config(self) -> bool:
+        try:
+            config_manager = ConfigManager(self.config_path, error_level=logging.ERROR)
+            config_manager.validate()
+            account_configs = {c["phone_number"]: c for c in config_manager.account_configs()}
+            service_adapters: Dict[str, LLMServiceAdapter] = {}
+            adapters = {
+                phone_number: self._get_service_adapter(account_config, service_adapters)
+                for phone_number, account_config in account_configs.items()
+            }
+            # Everything derived from the config is built before the first assignment below
+            config = config_manager.config
+            http_settings = HTTPClient.build_settings(config.get("http_timeouts"), config.get("http_retries"))
+            breaker_settings = config.get("llm_circuit_breaker", {})
+            failure_threshold = breaker_settings.get("failure_threshold", 5)
+            recovery_timeout = breaker_settings.get("recovery_timeout", 30.0)
+            circuit_breakers: Dict[str, CircuitBreaker] = {}
+            account_updates = [
+                self.accounts[phone_number].prepare_reconfigure(
+                    account_config, adapters[phone_number],
+                    self._get_circuit_breaker(account_config, breaker_settings, circuit_breakers)
+                )
+                for phone_number, account_config in account_configs.items() if phone_number in self.accounts
+            ]
+        except Exception as e:
+            logger.error("Config reload failed, keeping the current settings: %s", e)
+            return False
+
+        old = self.config_manager.config
+        changed = [key for key in RESTART_SETTINGS if old.get(key) != config.get(key)]
+        if set(account_configs) != set(self.accounts):
+            changed.append("accounts (phone numbers)")
+        if changed:
+            logger.warning("Changes to %s take effect after a restart", ', '.join(changed))
+
+        # Swap everything at once, no awaits from here on
+        self.config_manager = config_manager
+        self._service_adapters = service_adapters
+        if (old.get("log_level"), old.get("log_format")) != (config.get("log_level"), config.get("log_format")):
+            setup_logging(level=config.get("log_level", "INFO"), json_format=config.get("log_format") == "json")
+        HTTPClient.apply_settings(http_settings)
+        self._circuit_breakers = circuit_breakers
+        for circuit_breaker in circuit_breakers.values():
+            circuit_breaker.failure_threshold = failure_threshold
+            circuit_breaker.recovery_timeout = recovery_timeout
+        if config.get("llm_concurrency") and self.request_slots:
+            self.request_slots.resize(config["llm_concurrency"])
+        else:
+            # Requests holding a slot of the old limiter release it there.
+            self.request_slots = FairSlots(config["llm_concurrency"]) if config.get("llm_concurrency") else None
+        for account in self.accounts.values():
+            account.llm_client.request_slots = self.request_slots
+        for apply in account_updates:
+            apply()
+        logger.info("Configuration reloaded from %s", self.config_path)
+        return True
+
+    async def _watch_config(self, interval: float) -> None:
+        # Polls the config file's modification time. A half written file fails validation and is
+        # picked up again once the write completes.
+        last_modified = os.stat(self.config_path).st_mtime
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                modified = os.stat(self.config_path).st_mtime
+            except OSError:
+                continue
+            if modified != last_modified:
+                last_modified = modified
+                try:
+                    self.reload_config()
+                except Exception as e:
+                    # Keep watching, the next change may fix it
+                    logger.error("Config reload failed: %s", e)
+                    logger.debug("Traceback:", exc_info=True)
     
     async def run(self):
-        await self.signal_client.start()
+        await self._serve(asyncio.gather(*[
+            account.signal_client.start() for account in self.accounts.values()
+        ]))
+    
+    async def run_partition(self, inbox) -> None:
+        logger.info("Worker %s ready", self.partition)
+        await self._serve(consume(inbox, self._handle_dispatched))
+    
+    async def _handle_dispatched(self, item) -> None:
+        phone_number, raw_message = item
+        account = self.accounts.get(phone_number)
+        if not account:
+            logger.error("No account configured for %s", phone_number)
+            return
+        await account.signal_client._handle_message(raw_message)
+    
+    async def _serve(self, service) -> None:
+        # One connection pool per process, shared by all accounts
+        HTTPClient.open_session()
+        if self.metrics_server:
+            await self.metrics_server.start()
+        if self.profiler:
+            self.profiler.start()
+        # Reload on SIGHUP, and on changes to the file when "config_watch_interval" is set
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(signal.SIGHUP, self.reload_config)
+        watcher = None
+        if self.config_manager.config.get("config_watch_interval"):
+            watcher = asyncio.create_task(self._watch_config(self.config_manager.config["config_watch_interval"]))
+        try:
+            await service
+        finally:
+            if watcher:
+                watcher.cancel()
+            if hasattr(signal, "SIGHUP"):
+                loop.remove_signal_handler(signal.SIGHUP)
+            if self.profiler:
+                await self.profiler.stop()
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            await HTTPClient.close_session()
 
 
 async def main():
     try:
         api_key = os.getenv("API_KEY", "")
-        app = Application(api_key=api_key)
-        await app.run()
+        config_manager = ConfigManager("config.json")
+        workers = config_manager.config.get("workers", 1)
+        if workers > 1:
+            await WorkerPool(config_manager, "config.json", api_key, workers=workers).run()
+        else:
+            app = Application(api_key=api_key)
+            await app.run()
     except FileNotFoundError as e:
-        logger.critical(f"Configuration file not found: {e}")
+        logger.critical("Configuration file not found: %s", e)
         exit(1)
     except json.JSONDecodeError as e:
-        logger.critical(f"Invalid configuration JSON: {e}")
+        logger.critical("Invalid configuration JSON: %s", e)
         exit(1)
     except Exception as e:
-        logger.critical(f"Fatal error during initialization: {e}")
-        logger.debug(traceback.format_exc())
+        logger.critical("Fatal error during initialization: %s", e)
+        logger.debug("Traceback:", exc_info=True)
         exit(1)
 
 
@@ -104,6 +268,6 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Service stopped by user")
     except Exception as e:
-        logger.critical(f"Fatal error: {e}")
-        logger.debug(traceback.format_exc())
+        logger.critical("Fatal error: %s", e)
+        logger.debug("Traceback:", exc_info=True)
         exit(1)
@@ -1,3 +1,3 @@
-from memory.memory_manager import MemoryManager
+from memory.memory_manager import MemoryManager, MemoryMessage
 
-__all__ = ["MemoryManager"]
+__all__ = ["MemoryManager", "MemoryMessage"]
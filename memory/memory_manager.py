@@ -1,9 +1,33 @@
 import json
 import aiofiles
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional
 from utils.logging_setup import logger
 
 
+class MemoryMessage:
+    # One turn of the conversation. Turns never change once stored, so the serialized chat
+    # message is built once and reused for every following request.
+    __slots__ = ("role", "content", "_fragment")
+
+    def __init__(self, role: str, content: Any):
+        self.role = role
+        self.content = content
+        self._fragment: Optional[bytes] = None
+
+    def fragment(self) -> bytes:
+        if self._fragment is None:
+            self._fragment = json.dumps({"role": self.role, "content": self.content}).encode("utf-8")
+        return self._fragment
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {self.role: self.content}
+
+    @staticmethod
+    def from_dicts(messages: Iterable[Dict[str, Any]]) -> List["MemoryMessage"]:
+        # Stored and formatted messages are {role: text} dicts
+        return [MemoryMessage(role, content) for message in messages for role, content in message.items()]
+
+
 class MemoryManager:
     def __init__(self, has_memory=True, save_memory=True, memory_file="conversation_history.json"):
         self.has_memory = has_memory
@@ -12,19 +36,19 @@ class MemoryManager:
         self._conversation_memory = []
         
         if self.has_memory and self.save_memory:
-            logger.info(f"The conversation will be saved in {self._conversation_memory_file}.")
+            logger.info("The conversation will be saved in %s.", self._conversation_memory_file)
             self._conversation_memory = self._load_conversation_memory(self._conversation_memory_file)
     
-    def _load_conversation_memory(self, fp) -> List[Dict[str, str]]:
+    def _load_conversation_memory(self, fp) -> List[MemoryMessage]:
         try:
             with open(fp, "r") as f:
                 logger.info("Conversation memory loaded from file.")
-                return json.loads(f.read())["messages"]
+                return MemoryMessage.from_dicts(json.loads(f.read())["messages"])
         except FileNotFoundError:
-            logger.info(f"Conversation memory file not found, starting with empty memory.")
+            logger.info("Conversation memory file not found, starting with empty memory.")
             return []
         except Exception as e:
-            logger.error(f"Error loading conversation memory: {e}")
+            logger.error("Error loading conversation memory: %s", e)
             return []
     
     async def save_conversation(self) -> None:
@@ -33,24 +57,39 @@ class MemoryManager:
             
         try:
             async with aiofiles.open(self._conversation_memory_file, "w") as out:
-                escaped_json = json.dumps({"messages": self._conversation_memory})
+                escaped_json = json.dumps({"messages": [message.to_dict() for message in self._conversation_memory]})
                 await out.write(escaped_json)
                 await out.flush()
         except Exception as e:
-            logger.error(f"Failed to save conversation memory: {e}")
+            logger.error("Failed to save conversation memory: %s", e)
     
     def reset_memory(self) -> None:
         self._conversation_memory = []
         logger.info("Conversation memory reset")
     
     def add_user_message(self, message: Dict[str, str]) -> None:
-        self._conversation_memory.append(message)
+        self._conversation_memory.extend(MemoryMessage.from_dicts([message]))
     
     def add_model_response(self, message: Dict[str, str]) -> None:
-        self._conversation_memory.append(message)
+        self._conversation_memory.extend(MemoryMessage.from_dicts([message]))
+    
+    def set_system_prompt(self, system_prompt: Optional[Dict[str, str]]) -> None:
+        # Replaces, adds or (with None) removes the leading system message
+        memory = self._conversation_memory
+        if memory and memory[0].role == "system":
+            memory = memory[1:]
+        self._conversation_memory = MemoryMessage.from_dicts([system_prompt] if system_prompt else []) + memory
+    
+    def replace_message(self, old: MemoryMessage, new: MemoryMessage) -> bool:
+        # Searched from the end, where recently answered turns are
+        for index in range(len(self._conversation_memory) - 1, -1, -1):
+            if self._conversation_memory[index] is old:
+                self._conversation_memory[index] = new
+                return True
+        return False
     
-    def get_current_memory(self) -> List[Dict[str, str]]:
+    def get_current_memory(self) -> List[MemoryMessage]:
         return self._conversation_memory
     
-    def set_memory(self, memory: List) -> None:
-        self._conversation_memory = memory
+    def set_memory(self, memory: List[Dict[str, str]]) -> None:
+        self._conversation_memory = MemoryMessage.from_dicts(memory)
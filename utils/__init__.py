@@ -1,3 +1,4 @@
-from utils.logging_setup import logger, setup_logging
+from utils.logging_setup import logger, setup_logging, set_log_context, bind_log_context
+from utils.metrics import metrics, MetricsRegistry, MetricsServer
 
-__all__ = ["logger", "setup_logging"]
+__all__ = ["logger", "setup_logging", "set_log_context", "bind_log_context", "metrics", "MetricsRegistry", "MetricsServer"]
@@ -1,12 +1,161 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Any, Optional
 
 
-def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s"
-    )
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Fields attached to every record logged while a message is handled (conversation id, stage timings).
+_log_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("log_context", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def set_log_context(**fields) -> None:
+    _log_context.set(fields or None)
+
+
+def bind_log_context(**fields) -> None:
+    _log_context.set({**(_log_context.get() or {}), **fields})
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        if context:
+            # Snapshot now, the record is formatted later on the writer thread.
+            record.context = {
+                key: {stage: round(seconds, 4) for stage, seconds in value.items()} if key == "timings" else value
+                for key, value in context.items()
+            }
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through at most `burst` warnings/errors per call site every `window` seconds. The first record
+    # after a suppressed stretch reports how many were dropped.
+    def __init__(self, burst: int = 10, window: float = 60.0, max_sites: int = 1000):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.max_sites = max_sites
+        self._sites: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno, record.levelno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                if len(self._sites) >= self.max_sites:
+                    self._sites.clear()
+                # [window start, records let through, records suppressed]
+                site = self._sites[key] = [now, 0, 0]
+            if now - site[0] >= self.window:
+                if site[2]:
+                    record.suppressed = site[2]
+                site[:] = [now, 0, 0]
+            if site[1] >= self.burst:
+                site[2] += 1
+                return False
+            site[1] += 1
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" [{record.suppressed} similar messages suppressed]"
+        if getattr(record, "dropped", 0):
+            text += f" [{record.dropped} messages dropped, log writer fell behind]"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        context = getattr(record, "context", None)
+        if context:
+            entry.update(context)
+        for field in ("suppressed", "dropped"):
+            if getattr(record, field, 0):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Never blocks the event loop: records are dropped (and counted) when the writer falls behind.
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process, so the record is passed as is and formatted (message, traceback) on the writer thread.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._unreported:
+            record.dropped = self._unreported
+        try:
+            self.queue.put_nowait(record)
+            self._unreported = 0
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+
+def setup_logging(level=logging.INFO, json_format: bool = False, queue_size: int = 10000) -> logging.Logger:
+    # Handlers run on a background thread, callers only put records on a queue.
+    global _listener
+    _stop_listener()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT))
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
     return logging.getLogger(__name__)
 
 
+@atexit.register
+def _stop_listener() -> None:
+    # Writes out what is still queued
+    global _listener
+    if _listener:
+        try:
+            _listener.stop()
+        except queue.Full:
+            pass
+        _listener = None
+
+
 logger = setup_logging()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import aiofiles
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+from utils.logging_setup import logger
+from utils.metrics import metrics
+
+
+class ProfileSession:
+    __slots__ = ("started", "stacks", "samples", "max_loop_lag")
+
+    def __init__(self):
+        self.started = time.time()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.max_loop_lag = 0.0
+
+
+class SlowMessageProfiler:
+    # Samples the event loop thread's stack while messages are handled and keeps the samples of slow ones.
+    # Samples in the selector mean the loop was idle waiting for I/O; anything else was blocking the loop.
+    def __init__(self, threshold: float, sample_interval: float = 0.005, lag_interval: float = 0.1,
+                 profile_path: str = "./files/profiles/"):
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.lag_interval = lag_interval
+        self.profile_path = profile_path
+        self.loop_lag = metrics.histogram(
+            "signalllm_event_loop_lag_seconds", "Event loop scheduling delay.",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+        )
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lag_task: Optional[asyncio.Task] = None
+        self._dumps = 0
+
+    def start(self) -> None:
+        os.makedirs(self.profile_path, exist_ok=True)
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="slow-message-profiler", daemon=True)
+        self._thread.start()
+        self._lag_task = asyncio.create_task(self._monitor_loop_lag())
+        logger.info("Profiling messages slower than %s s to %s", self.threshold, self.profile_path)
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._lag_task:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+
+    def begin(self) -> ProfileSession:
+        session = ProfileSession()
+        with self._lock:
+            self._sessions.append(session)
+        return session
+
+    async def end(self, session: ProfileSession, elapsed: float, timings: Optional[Dict[str, float]],
+                  outcome: str) -> None:
+        with self._lock:
+            self._sessions.remove(session)
+        if elapsed < self.threshold:
+            return
+
+        self._dumps += 1
+        filepath = f"{self.profile_path}slow-{int(session.started * 1000)}-{self._dumps}.json"
+        report = {
+            "started": session.started,
+            "elapsed": elapsed,
+            "outcome": outcome,
+            "timings": timings or {},
+            "max_loop_lag": session.max_loop_lag,
+            "sample_interval": self.sample_interval,
+            "samples": session.samples,
+            # Collapsed stacks (root;...;leaf -> count), usable with flamegraph tools.
+            "stacks": dict(session.stacks.most_common())
+        }
+        try:
+            async with aiofiles.open(filepath, "w") as out:
+                await out.write(json.dumps(report, indent=1))
+            logger.warning("Slow message (%.2f s). Profile written to %s", elapsed, filepath)
+        except Exception as e:
+            logger.error("Failed to write profile: %s", e)
+
+    async def _monitor_loop_lag(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.perf_counter() - start - self.lag_interval)
+            self.loop_lag.observe(lag)
+            with self._lock:
+                for session in self._sessions:
+                    session.max_loop_lag = max(session.max_loop_lag, lag)
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            if not self._sessions:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = self._fold(frame)
+            with self._lock:
+                for session in self._sessions:
+                    session.stacks[stack] += 1
+                    session.samples += 1
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
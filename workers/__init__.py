@@ -0,0 +1,3 @@
+from workers.worker_pool import WorkerPool
+
+__all__ = ["WorkerPool"]
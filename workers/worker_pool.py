@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from clients.signal_client import SignalClient
+from clients.websocket_client import WebsocketClient
+from config.config_manager import ConfigManager
+from utils.logging_setup import logger, setup_logging
+from utils.metrics import metrics, MetricsServer
+
+
+def run_worker(index: int, api_key: str, config_path: str, inbox: multiprocessing.Queue) -> None:
+    # Entry point of a worker process. Imported lazily: main imports this module.
+    from main import Application
+    try:
+        app = Application(api_key=api_key, config_path=config_path, partition=index)
+        asyncio.run(app.run_partition(inbox))
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    # Owns the websocket connection(s) and shards envelopes over worker processes by account and recipient,
+    # so every conversation is always handled by the same worker (and its memory partition).
+    def __init__(self, config_manager: ConfigManager, config_path: str, api_key: str, workers: int,
+                 supervise_interval: float = 2.0):
+        self.config = config_manager.config
+        setup_logging(level=self.config.get("log_level", "INFO"), json_format=self.config.get("log_format") == "json")
+        self._log_settings = (self.config.get("log_level"), self.config.get("log_format"))
+        self.config_path = config_path
+        self.api_key = api_key
+        self.workers = workers
+        self.supervise_interval = supervise_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue() for _ in range(workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._started_at = [0.0] * workers
+        self._crashes = [0] * workers
+        self._restart_at = [0.0] * workers
+        self._dispatched = metrics.counter(
+            "signalllm_worker_dispatched_total", "Envelopes dispatched, by worker.", ("worker",)
+        )
+        self._restarts = metrics.counter(
+            "signalllm_worker_restarts_total", "Worker processes restarted after exiting.", ("worker",)
+        )
+        # (client, heartbeat settings of its account)
+        self.websocket_clients: List[Tuple[WebsocketClient, Dict[str, Optional[float]]]] = []
+        for account_config in config_manager.account_configs():
+            phone_number = account_config["phone_number"]
+            ws_uri = f"ws://{account_config['signal_service']}/v1/receive/{phone_number}"
+            catch_up = None
+            if account_config.get("catch_up_on_reconnect", False):
+                catch_up = self._catch_up(account_config["signal_service"], phone_number)
+            self.websocket_clients.append((
+                WebsocketClient(ws_uri, self._dispatcher(phone_number), on_reconnect=catch_up, name=phone_number),
+                {
+                    "ping_interval": account_config.get("websocket_ping_interval", 20),
+                    "ping_timeout": account_config.get("websocket_ping_timeout", 20)
+                }
+            ))
+
+    @staticmethod
+    def shard(recipient: Optional[str], workers: int) -> int:
+        # Stable across processes and restarts, unlike hash().
+        return zlib.crc32((recipient or "").encode("utf-8")) % workers
+
+    def _dispatcher(self, phone_number: str):
+        async def dispatch(raw_message: str) -> None:
+            await self.dispatch(phone_number, raw_message)
+        return dispatch
+
+    def _catch_up(self, signal_service: str, phone_number: str):
+        async def catch_up() -> List[str]:
+            # Dispatched like received messages. Duplicates are dropped by the worker that owns the conversation.
+            return await SignalClient.fetch_pending(signal_service, phone_number)
+        return catch_up
+
+    async def dispatch(self, phone_number: str, raw_message: str) -> None:
+        try:
+            envelope = json.loads(raw_message).get("envelope", {})
+        except json.JSONDecodeError as e:
+            logger.error("Invalid JSON in message: %s", e)
+            return
+        index = self.shard(f"{phone_number}/{SignalClient.get_recipient(envelope)}", self.workers)
+        self._queues[index].put((phone_number, raw_message))
+        self._dispatched.inc(worker=index)
+
+    def _start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self.api_key, self.config_path, self._queues[index]),
+            name=f"signal-llm-worker-{index}",
+            daemon=True
+        )
+        if hasattr(signal, "SIGHUP"):
+            # The worker inherits an ignored SIGHUP, so a reload forwarded while it is still starting
+            # does not kill it. It installs its own handler once it serves.
+            previous = signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            try:
+                process.start()
+            finally:
+                signal.signal(signal.SIGHUP, previous)
+        else:
+            process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info("Started worker %s (pid %s)", index, process.pid)
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(self.supervise_interval)
+            now = time.monotonic()
+            for index, process in enumerate(self._processes):
+                if process is None or process.is_alive():
+                    continue
+                if not self._restart_at[index]:
+                    # A worker that died while reading leaves the queue's lock held. Its backlog is lost with it,
+                    # new envelopes wait in a fresh queue for the replacement.
+                    self._queues[index].close()
+                    self._queues[index] = self._context.Queue()
+                    # Back off when a worker keeps crashing right after start.
+                    crashed_early = now - self._started_at[index] < 30
+                    self._crashes[index] = self._crashes[index] + 1 if crashed_early else 0
+                    delay = min(60, 2 ** self._crashes[index]) if self._crashes[index] else 0
+                    self._restart_at[index] = now + delay
+                    logger.error("Worker %s exited with code %s, restarting in %s s", index, process.exitcode, delay)
+                if now >= self._restart_at[index]:
+                    self._restart_at[index] = 0.0
+                    self._restarts.inc(worker=index)
+                    self._start_worker(index)
+
+    async def run(self) -> None:
+        metrics_server = None
+        if self.config.get("metrics_port"):
+            metrics_server = MetricsServer(
+                metrics, host=self.config.get("metrics_host", "127.0.0.1"), port=self.config["metrics_port"]
+            )
+            await metrics_server.start()
+
+        for index in range(self.workers):
+            self._start_worker(index)
+        supervisor = asyncio.create_task(self._supervise())
+        if hasattr(signal, "SIGHUP"):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.reload_workers)
+        logger.info("Starting Signal API Relay service with %s workers...", self.workers)
+        try:
+            await asyncio.gather(*[
+                websocket_client.connect(**heartbeat)
+                for websocket_client, heartbeat in self.websocket_clients
+            ])
+        finally:
+            supervisor.cancel()
+            await self.stop()
+            if metrics_server:
+                await metrics_server.stop()
+
+    def reload_workers(self) -> None:
+        # The config is reloaded by each worker. The connections owned here keep their settings,
+        # only the logging settings are applied here as well.
+        try:
+            config_manager = ConfigManager(self.config_path, error_level=logging.ERROR)
+            config_manager.validate()
+        except Exception as e:
+            logger.error("Config reload failed, keeping the current settings: %s", e)
+        else:
+            config = config_manager.config
+            log_settings = (config.get("log_level"), config.get("log_format"))
+            if log_settings != self._log_settings:
+                self._log_settings = log_settings
+                setup_logging(level=config.get("log_level", "INFO"), json_format=config.get("log_format") == "json")
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        for inbox in self._queues:
+            inbox.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process is not None:
+                await loop.run_in_executor(None, process.join, timeout)
+                if process.is_alive():
+                    process.terminate()
+
+
+async def consume(inbox: multiprocessing.Queue, handler) -> None:
+    # Runs in a worker process. Envelopes are handled one at a time, in order.
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            raw_message = await loop.run_in_executor(None, inbox.get, True, 1.0)
+        except queue.Empty:
+            continue
+        if raw_message is None:
+            break
+        await handler(raw_message)